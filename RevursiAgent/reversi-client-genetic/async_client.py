@@ -0,0 +1,132 @@
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from reversi import parse_game_state, format_move
+from reversi_bot import ReversiBot
+
+# Runs many bots from one asyncio process. Each bot's connection is a
+# coroutine that reads the server's messages with proper line framing, so a
+# message split over several reads (or several messages in one read) is
+# handled. Searching is CPU-bound and runs in worker processes: every bot is
+# pinned to one worker, which builds the bot the first time it is asked for
+# a move and keeps it (and its transposition table) between moves. With more
+# bots than workers a state can wait in the executor's queue while the
+# server's clock runs, so the bot's budget counts from when the state
+# arrived, not from when the worker gets to it. perf_counter is a
+# system-wide clock on Linux and macOS, so the worker can compare against it.
+#
+# A bot is described by a spec, a dict with:
+#     host, port                  server to connect to (port defaults to 3333 + player)
+#     player                      1 or 2
+#     max_depth, weights          as for reversi_python_client.py
+#     pattern_file, book_file     optional, as for reversi_python_client.py
+#     table_bytes                 optional transposition table size
+
+# Number of lines in a state message: turn, round, t1, t2 and 64 squares
+MESSAGE_LINES = 68
+GAME_OVER = '-999'
+
+# Bots built in this worker process, by bot id
+_bots = {}
+
+
+def build_bot(spec):
+    evaluator = None
+    if spec.get('pattern_file'):
+        from patterns import PatternEvaluator
+        evaluator = PatternEvaluator.load(spec['pattern_file'])
+    book = None
+    if spec.get('book_file'):
+        from opening_book import OpeningBook
+        book = OpeningBook(spec['book_file'])
+    kwargs = {}
+    if 'table_bytes' in spec:
+        kwargs['table_bytes'] = spec['table_bytes']
+    return ReversiBot(spec['player'], spec['max_depth'], *spec['weights'], evaluator=evaluator, book=book, **kwargs)
+
+
+def make_move_in_worker(bot_id, spec, state, received=None):
+    '''
+        Executor entry point: the move of bot bot_id, built from spec if
+        new. received is the time.perf_counter() at which the state arrived.
+    '''
+    if bot_id not in _bots:
+        _bots[bot_id] = build_bot(spec)
+    return _bots[bot_id].make_move(state, received)
+
+
+def close_in_worker(bot_id):
+    bot = _bots.pop(bot_id, None)
+    if bot is not None:
+        bot.close()
+
+
+async def read_message(reader):
+    '''
+        Lines of the next server message: [GAME_OVER] at the end of the
+        game, otherwise the MESSAGE_LINES lines of a state. The blank line
+        the server sends after each state is skipped.
+    '''
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        line = line.decode('utf-8').strip()
+        if not line:
+            continue
+        lines.append(line)
+        if lines[0] == GAME_OVER or len(lines) == MESSAGE_LINES:
+            return lines
+
+
+async def play_game(bot_id, spec, executor):
+    '''Play one game for one bot, searching in executor'''
+    player = spec['player']
+    port = spec.get('port', 3333 + player)
+    reader, writer = await asyncio.open_connection(spec.get('host', 'localhost'), port)
+    loop = asyncio.get_running_loop()
+    try:
+        # The server starts with "<player> <minutes>"
+        await reader.readline()
+        while True:
+            state = parse_game_state(await read_message(reader))
+            received = time.perf_counter()
+            if state.turn == -999:
+                return
+            # The other player's updates carry a turn of 0 or -1
+            if state.turn == player:
+                move = await loop.run_in_executor(executor, make_move_in_worker, bot_id, spec, state, received)
+                writer.write(format_move(move).encode('utf-8'))
+                await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+        await loop.run_in_executor(executor, close_in_worker, bot_id)
+
+
+async def run_bots(specs, processes=1):
+    '''
+        Play one game for every spec at once on "processes" worker
+        processes and return the exceptions of the games that failed
+    '''
+    executors = [ProcessPoolExecutor(max_workers=1) for _ in range(processes)]
+    try:
+        games = [play_game(bot_id, spec, executors[bot_id % processes]) for bot_id, spec in enumerate(specs)]
+        results = await asyncio.gather(*games, return_exceptions=True)
+    finally:
+        for executor in executors:
+            executor.shutdown()
+    return [result for result in results if isinstance(result, Exception)]
+
+
+if __name__ == "__main__":
+    # python async_client.py <bots.json> [processes]
+    # bots.json holds a list of bot specs
+    with open(sys.argv[1]) as f:
+        specs = json.load(f)
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    for error in asyncio.run(run_bots(specs, processes)):
+        print(f"Game failed: {error!r}")
@@ -0,0 +1,236 @@
+import numpy as np
+from bitboard import POSITION_VALUES, COL_0, COL_7, NOT_COL_0, NOT_COL_7, ROW_0, ROW_7, EDGES, \
+    DIAGONALS_9, DIAGONALS_7
+
+# Batched versions of the ReversiGameState board functions. Every function
+# takes N boards stacked into an (N, 8, 8) int array of 0s, 1s and 2s and a
+# turn per board (an int applies the same turn to all of them), and does the
+# work for all boards in a handful of NumPy calls.
+
+DIRECTIONS = [(dr, dc) for dr in range(-1, 2) for dc in range(-1, 2) if not (dr == 0 and dc == 0)]
+POSITION_TABLE = np.array(POSITION_VALUES)
+CORNER_MASK = np.zeros((8, 8), dtype=bool)
+CORNER_MASK[[0, 0, 7, 7], [0, 7, 0, 7]] = True
+STEPS = np.arange(1, 8)
+SQUARE_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+
+def _turns(boards, turns):
+    return np.broadcast_to(np.asarray(turns), (boards.shape[0],))[:, None, None]
+
+
+def _shift(x, dr, dc):
+    '''Return y with y[:, r, c] = x[:, r - dr, c - dc], padding with zeros'''
+    out = np.zeros_like(x)
+    dst_rows = slice(max(dr, 0), 8 + min(dr, 0))
+    src_rows = slice(max(-dr, 0), 8 + min(-dr, 0))
+    dst_cols = slice(max(dc, 0), 8 + min(dc, 0))
+    src_cols = slice(max(-dc, 0), 8 + min(-dc, 0))
+    out[:, dst_rows, dst_cols] = x[:, src_rows, src_cols]
+    return out
+
+
+def _near_empty(empty):
+    near = np.zeros_like(empty)
+    for dr, dc in DIRECTIONS:
+        near |= _shift(empty, dr, dc)
+    return near
+
+
+def _to_bits(mask):
+    '''Pack an (N, 8, 8) bool array into (N,) uint64 bitboards, square row * 8 + col'''
+    return np.bitwise_or.reduce(np.where(mask.reshape(-1, 64), SQUARE_BITS, np.uint64(0)), axis=1)
+
+
+def _full_lines(occupied, lines):
+    full = np.zeros_like(occupied)
+    for line in lines:
+        line = np.uint64(line)
+        full |= np.where(occupied & line == line, line, np.uint64(0))
+    return full
+
+
+def _stability_anchors(occupied):
+    '''bitboard.stability_anchors for (N,) uint64 boards, without the early out'''
+    rows = occupied & (occupied >> np.uint64(1))
+    rows &= rows >> np.uint64(2)
+    rows &= rows >> np.uint64(4)
+    cols = occupied & (occupied >> np.uint64(32))
+    cols &= cols >> np.uint64(16)
+    cols &= cols >> np.uint64(8)
+    return ((rows & np.uint64(COL_0)) * np.uint64(0xFF) | np.uint64(COL_0 | COL_7),
+            (cols & np.uint64(0xFF)) * np.uint64(COL_0) | np.uint64(ROW_0 | ROW_7),
+            _full_lines(occupied, DIAGONALS_9) | np.uint64(EDGES),
+            _full_lines(occupied, DIAGONALS_7) | np.uint64(EDGES))
+
+
+def _grow_stable(own, anchors):
+    '''bitboard.grow_stable for (N,) uint64 boards, until no board changes'''
+    horizontal, vertical, diagonal_9, diagonal_7 = anchors
+    not_col_0 = np.uint64(NOT_COL_0)
+    not_col_7 = np.uint64(NOT_COL_7)
+    shifts = {shift: np.uint64(shift) for shift in (1, 7, 8, 9)}
+    stable = np.zeros_like(own)
+    while True:
+        grown = own & \
+            (horizontal | ((stable << shifts[1]) & not_col_0) | ((stable >> shifts[1]) & not_col_7)) & \
+            (vertical | (stable << shifts[8]) | (stable >> shifts[8])) & \
+            (diagonal_9 | ((stable << shifts[9]) & not_col_0) | ((stable >> shifts[9]) & not_col_7)) & \
+            (diagonal_7 | ((stable << shifts[7]) & not_col_7) | ((stable >> shifts[7]) & not_col_0))
+        if np.array_equal(grown, stable):
+            return stable
+        stable = grown
+
+
+def _stability(own, opp):
+    '''bitboard.stability for every board, as a (N,) float array'''
+    own = _to_bits(own)
+    opp = _to_bits(opp)
+    anchors = _stability_anchors(own | opp)
+    own_stable = np.bitwise_count(_grow_stable(own, anchors)).astype(float)
+    opp_stable = np.bitwise_count(_grow_stable(opp, anchors)).astype(float)
+    total = own_stable + opp_stable
+    return np.divide(100.0 * (own_stable - opp_stable), total, out=np.zeros(len(own)), where=total != 0)
+
+
+def legal_move_masks(boards, turns):
+    '''
+        Return an (N, 8, 8) bool array that is True on every valid move for
+        the player to move, with the same opening rule as get_valid_moves:
+        while a middle square is empty those are the only moves.
+    '''
+    boards = np.asarray(boards)
+    turns = _turns(boards, turns)
+    own = boards == turns
+    opp = boards == 3 - turns
+    empty = boards == 0
+
+    moves = np.zeros_like(empty)
+    for dr, dc in DIRECTIONS:
+        # Walk runs of opponent stones away from our stones; a run that ends
+        # on an empty square means that square captures back toward us
+        x = _shift(own, dr, dc) & opp
+        for _ in range(5):
+            x |= _shift(x, dr, dc) & opp
+        moves |= _shift(x, dr, dc) & empty
+
+    center_moves = np.zeros_like(empty)
+    center_moves[:, 3:5, 3:5] = empty[:, 3:5, 3:5]
+    center_open = center_moves.any(axis=(1, 2))
+    return np.where(center_open[:, None, None], center_moves, moves)
+
+
+def apply_moves(boards, turns, moves):
+    '''
+        Return copies of the boards after each board's player to move plays
+        the matching (row, col) in the (N, 2) "moves" array. Like
+        simulate_move the stone is placed even if nothing is flipped.
+    '''
+    boards = np.array(boards)
+    n = boards.shape[0]
+    turns = _turns(boards, turns)[:, 0, 0]
+    moves = np.asarray(moves)
+    index = np.arange(n)[:, None]
+
+    flip_rows = []
+    flip_cols = []
+    flip_mask = []
+    for dr, dc in DIRECTIONS:
+        rows = moves[:, 0:1] + STEPS * dr
+        cols = moves[:, 1:2] + STEPS * dc
+        on_board = (rows >= 0) & (rows < 8) & (cols >= 0) & (cols < 8)
+        values = np.where(on_board, boards[index, rows.clip(0, 7), cols.clip(0, 7)], 0)
+
+        # Length of the run of opponent stones, then whether our stone ends it
+        is_opp = values == (3 - turns)[:, None]
+        run = np.argmin(np.concatenate([is_opp, np.zeros((n, 1), dtype=bool)], axis=1), axis=1)
+        ends_on_own = values[np.arange(n), run.clip(0, 6)] == turns
+        captures = (run > 0) & ends_on_own & (run < 7)
+
+        flip_rows.append(rows)
+        flip_cols.append(cols)
+        flip_mask.append((STEPS[None, :] <= run[:, None]) & captures[:, None])
+
+    flip_rows = np.concatenate(flip_rows, axis=1)
+    flip_cols = np.concatenate(flip_cols, axis=1)
+    flip_mask = np.concatenate(flip_mask, axis=1)
+    board_index = np.broadcast_to(index, flip_mask.shape)
+
+    boards[board_index[flip_mask], flip_rows[flip_mask], flip_cols[flip_mask]] = \
+        np.broadcast_to(turns[:, None], flip_mask.shape)[flip_mask]
+    boards[np.arange(n), moves[:, 0], moves[:, 1]] = turns
+    return boards
+
+
+def expand_children(board, turn):
+    '''
+        Return the valid moves of a single board and an (M, 8, 8) stack of
+        the boards they lead to, so all children can be scored in one call.
+    '''
+    mask = legal_move_masks(np.asarray(board)[None], turn)[0]
+    moves = np.argwhere(mask)
+    if len(moves) == 0:
+        return [], np.zeros((0, 8, 8), dtype=int)
+    children = apply_moves(np.broadcast_to(board, (len(moves), 8, 8)), turn, moves)
+    return [tuple(int(x) for x in move) for move in moves], children
+
+
+def get_features(boards, turns):
+    '''
+        Compute the get_score features for every board from the point of
+        view of its player to move. Returns a dict of (N,) float arrays keyed
+        by feature name, unweighted and without the per-weight cutoffs.
+    '''
+    boards = np.asarray(boards)
+    turns = _turns(boards, turns)
+    own = boards == turns
+    opp = boards == 3 - turns
+    empty = boards == 0
+
+    own_count = own.sum(axis=(1, 2))
+    opp_count = opp.sum(axis=(1, 2))
+    total = own_count + opp_count
+    coin_parity = np.divide(100.0 * (own_count - opp_count), total,
+                            out=np.zeros(len(boards)), where=total != 0)
+
+    mobility = 100 * legal_move_masks(boards, turns[:, 0, 0]).sum(axis=(1, 2)) / 64
+    corners = 25.0 * (own & CORNER_MASK).sum(axis=(1, 2))
+    # Stable discs are grown on (N,) uint64 bitboards, a few rounds for all boards at once
+    stable = _stability(own, opp)
+    positional = (own * POSITION_TABLE).sum(axis=(1, 2)) / 100
+    frontier = 2.0 * (own & _near_empty(empty)).sum(axis=(1, 2))
+
+    return {
+        'coin_parity': coin_parity,
+        'mobility': mobility,
+        'corners_captured': corners,
+        'stability': stable,
+        'positional_weight': positional,
+        'frontier_discs': frontier,
+    }
+
+
+def get_scores(boards, turns, weights, rng=None):
+    '''
+        Batched ReversiGameState.get_score: weight the features with the
+        seven genome weights, applying the same "ignore small weights" cutoffs.
+    '''
+    w_1, w_2, w_3, w_4, w_5, w_6, w_7 = weights
+    features = get_features(boards, turns)
+    scores = np.zeros(len(features['coin_parity']))
+    if w_1 >= 0.2:
+        scores += w_1 * features['coin_parity']
+    if w_2 >= 0.2:
+        scores += w_2 * features['mobility']
+    if w_3 >= 0.2:
+        scores += w_3 * features['corners_captured']
+    if w_4 >= 0.2:
+        scores += w_4 * features['stability']
+    if w_5 >= 0.1:
+        scores += w_5 * features['positional_weight']
+    if w_6 >= 0.1:
+        rng = rng if rng is not None else np.random.default_rng()
+        scores += w_6 * rng.uniform(0, 100, size=len(scores))
+    if w_7 >= 0.1:
+        scores += w_7 * features['frontier_discs']
+    return scores
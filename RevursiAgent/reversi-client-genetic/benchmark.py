@@ -0,0 +1,259 @@
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import numpy as np
+from bitboard import BitboardGameState
+from reversi import ReversiGameState
+from reversi_bot import MiniMax, ReversiBot, MTD_STEP
+
+# Engine benchmarks, in two layers:
+#   perft       leaf counts of the full game tree to a fixed depth, from the
+#               empty board and from a few mid-game positions, on both board
+#               backends. They must agree with each other and with PERFT_START.
+#   throughput  get_valid_moves, simulate_move and get_score calls per second
+#               and MiniMax nodes per second at fixed depths.
+#   search      nodes each search algorithm needs for iterative deepening to
+#               a fixed depth with the bot's table and move ordering. Every
+#               algorithm must find the same root score as alpha-beta.
+# Results are saved as JSON; "compare" checks a run against a baseline.
+#
+#   python benchmark.py run <output json> [quick]
+#   python benchmark.py compare <baseline json> <new json> [tolerance]
+
+# Leaf counts from the empty board (the first 4 plies fill the center)
+PERFT_START = {1: 4, 2: 12, 3: 24, 4: 24, 5: 96, 6: 320, 7: 1536, 8: 6624, 9: 38208}
+
+# Weights for get_score and MiniMax. The random weight is 0 so runs repeat.
+WEIGHTS = (0.234, 0.5999, 0.3, 0.405, 0.777, 0, 0.2)
+
+BACKENDS = ('bitboard', 'numpy')
+
+# (name, algorithm, aspiration window) for the search section
+SEARCH_VARIANTS = [
+    ('alphabeta', 'alphabeta', 0),
+    ('pvs', 'pvs', 0),
+    ('pvs_aspiration', 'pvs', 25),
+    ('mtdf', 'mtdf', 0),
+]
+
+
+def new_state(backend, board, turn):
+    state = ReversiGameState(np.array(board), turn, *WEIGHTS)
+    if backend == 'bitboard':
+        state = BitboardGameState.from_state(state)
+    return state
+
+
+def perft(state, depth):
+    '''Leaves of the game tree below state. A pass counts as a move, a finished game as a leaf.'''
+    if depth == 0:
+        return 1
+    moves = state.get_valid_moves()
+    if not moves:
+        state.make_move(None)
+        if state.get_valid_moves():
+            count = perft(state, depth - 1)
+        else:
+            count = 1
+        state.unmake_move()
+        return count
+    count = 0
+    for move in moves:
+        state.make_move(move)
+        count += perft(state, depth - 1)
+        state.unmake_move()
+    return count
+
+
+def benchmark_positions(count=6, seed=470):
+    '''Mid-game (board, turn) positions reached by seeded random play, 20 to 40 plies in'''
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        state = BitboardGameState([0, 0, 0], 1, *WEIGHTS)
+        plies = 20 + 20 * len(positions) // max(1, count - 1)
+        for _ in range(plies):
+            moves = state.get_valid_moves()
+            if not moves:
+                break
+            state.make_move(rng.choice(moves))
+        else:
+            positions.append((state.board.tolist(), state.turn))
+    return positions
+
+
+def rate(function, items, min_seconds):
+    '''Calls of function per second over items, repeated for at least min_seconds'''
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        for item in items:
+            function(item)
+        calls += len(items)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return calls / elapsed
+
+
+def run_perft(positions, start_depth, position_depth):
+    results = {'start': {}, 'positions': [], 'ok': True}
+    for depth in range(1, start_depth + 1):
+        counts = {backend: perft(new_state(backend, np.zeros((8, 8), dtype=int), 1), depth)
+                  for backend in BACKENDS}
+        ok = len(set(counts.values())) == 1 and counts['bitboard'] == PERFT_START.get(depth, counts['bitboard'])
+        results['start'][depth] = {'counts': counts, 'ok': ok}
+        results['ok'] &= ok
+    for board, turn in positions:
+        counts = {backend: perft(new_state(backend, board, turn), position_depth) for backend in BACKENDS}
+        ok = len(set(counts.values())) == 1
+        results['positions'].append({'depth': position_depth, 'counts': counts, 'ok': ok})
+        results['ok'] &= ok
+    return results
+
+
+def run_throughput(positions, search_depths, min_seconds):
+    results = {}
+    for backend in BACKENDS:
+        states = [new_state(backend, board, turn) for board, turn in positions]
+        moves = [(state, move) for state in states for move in state.get_valid_moves()]
+        backend_results = {
+            'get_valid_moves_per_second': rate(lambda state: state.get_valid_moves(), states, min_seconds),
+            'get_score_per_second': rate(lambda state: state.get_score(state.turn), states, min_seconds),
+        }
+
+        # simulate_move changes the state, so it is timed on fresh copies
+        calls = 0
+        elapsed = 0.0
+        while elapsed < min_seconds:
+            copies = [(state.clone_state(), move) for state, move in moves]
+            started = time.perf_counter()
+            for state, move in copies:
+                state.simulate_move(move)
+            elapsed += time.perf_counter() - started
+            calls += len(copies)
+        backend_results['simulate_move_per_second'] = calls / elapsed
+
+        for depth in search_depths:
+            nodes = 0
+            started = time.perf_counter()
+            for state in states:
+                searcher = MiniMax(state.clone_state(), depth)
+                searcher.search()
+                nodes += searcher.nodes
+            elapsed = time.perf_counter() - started
+            backend_results[f'minimax_depth_{depth}'] = {'nodes': nodes, 'nodes_per_second': nodes / elapsed}
+        results[backend] = backend_results
+    return results
+
+
+def run_search(positions, depth):
+    '''Nodes and root scores of iterative deepening to depth, for each of SEARCH_VARIANTS'''
+    results = {'depth': depth, 'variants': {}, 'ok': True}
+    reference = None
+    for name, algorithm, window in SEARCH_VARIANTS:
+        nodes = 0
+        values = []
+        started = time.perf_counter()
+        for board, turn in positions:
+            state = new_state('bitboard', board, turn)
+            bot = ReversiBot(turn, depth, *WEIGHTS, endgame_empties=0, algorithm=algorithm,
+                             aspiration_window=window)
+            bot.table.new_search()
+            bot.orderer.new_search()
+            searcher = None
+            for iteration in range(1, depth + 1):
+                searcher = bot.search(state, iteration, previous=searcher)
+                nodes += searcher.nodes
+            values.append(searcher.value)
+        seconds = time.perf_counter() - started
+        if reference is None:
+            reference = (nodes, values)
+        # MTD(f) only pins the score down to within MTD_STEP
+        ok = all(abs(value - expected) <= MTD_STEP + 1e-6 for value, expected in zip(values, reference[1]))
+        results['variants'][name] = {'nodes': nodes, 'relative_nodes': nodes / reference[0],
+                                     'seconds': seconds, 'ok': ok}
+        results['ok'] &= ok
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(quick=False):
+    positions = benchmark_positions()
+    started = time.perf_counter()
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'perft': run_perft(positions, 6 if quick else 8, 2 if quick else 3),
+        'throughput': run_throughput(positions, (1, 2) if quick else (1, 2, 3), 0.2 if quick else 1.0),
+        'search': run_search(positions, 4 if quick else 6),
+    }
+    results['meta']['seconds'] = time.perf_counter() - started
+    return results
+
+
+def rates(throughput, prefix=''):
+    '''Flatten the throughput section into {name: per-second figure}'''
+    flat = {}
+    for name, value in throughput.items():
+        if isinstance(value, dict):
+            flat.update(rates(value, f"{prefix}{name}."))
+        elif name.endswith('per_second'):
+            flat[prefix + name] = value
+    return flat
+
+
+def compare(baseline, new, tolerance=0.1):
+    '''
+        Print every throughput figure of new relative to baseline. Returns
+        False if perft failed or anything got slower by more than tolerance.
+    '''
+    ok = new['perft']['ok']
+    if not ok:
+        print("perft: counts don't match")
+    if 'search' in new:
+        for name, variant in new['search']['variants'].items():
+            old = baseline.get('search', {}).get('variants', {}).get(name)
+            old_nodes = f"{old['nodes']:12d}" if old is not None else f"{'':12s}"
+            flag = '' if variant['ok'] else "  SCORE DIFFERS FROM ALPHABETA"
+            print(f"search.{name:53s} {old_nodes} {variant['nodes']:12d} nodes{flag}")
+            ok &= variant['ok']
+    old_rates = rates(baseline['throughput'])
+    new_rates = rates(new['throughput'])
+    for name in sorted(old_rates.keys() & new_rates.keys()):
+        ratio = new_rates[name] / old_rates[name]
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  REGRESSION'
+            ok = False
+        print(f"{name:60s} {old_rates[name]:12.0f} {new_rates[name]:12.0f} {ratio:6.2f}x{flag}")
+    return ok
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == 'run':
+        results = run(quick=len(sys.argv) > 3 and sys.argv[3] == 'quick')
+        with open(sys.argv[2], 'w') as f:
+            json.dump(results, f, indent=2)
+        print(json.dumps(results, indent=2))
+        sys.exit(0 if results['perft']['ok'] and results['search']['ok'] else 1)
+    else:
+        with open(sys.argv[2]) as f:
+            baseline = json.load(f)
+        with open(sys.argv[3]) as f:
+            new = json.load(f)
+        tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+        sys.exit(0 if compare(baseline, new, tolerance) else 1)
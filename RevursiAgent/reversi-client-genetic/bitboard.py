@@ -0,0 +1,574 @@
+import random
+import numpy as np
+from transposition import ZOBRIST_PIECES, ZOBRIST_FLIP, ZOBRIST_TURN, zobrist_hash
+
+# Squares are numbered row * 8 + col, so bit 0 is board[0, 0] and bit 63 is
+# board[7, 7]. Each player's stones live in their own 64-bit mask.
+FULL = 0xFFFFFFFFFFFFFFFF
+COL_0 = 0x0101010101010101
+COL_7 = 0x8080808080808080
+NOT_COL_0 = FULL ^ COL_0
+NOT_COL_7 = FULL ^ COL_7
+ROW_0 = 0xFF
+ROW_7 = 0xFF << 56
+EDGES = COL_0 | COL_7 | ROW_0 | ROW_7
+CORNERS = (1 << 0) | (1 << 7) | (1 << 56) | (1 << 63)
+CENTER = (1 << 27) | (1 << 28) | (1 << 35) | (1 << 36)
+
+# Deepest line make_move can play before unmake_move, passes included
+UNDO_STACK_SIZE = 128
+
+# (shift, mask) pairs. The mask drops bits that wrapped around to the other
+# side of the board after the shift.
+LEFT_SHIFTS = [
+    (1, NOT_COL_0),   # col + 1
+    (8, FULL),        # row + 1
+    (9, NOT_COL_0),   # row + 1, col + 1
+    (7, NOT_COL_7),   # row + 1, col - 1
+]
+RIGHT_SHIFTS = [
+    (1, NOT_COL_7),   # col - 1
+    (8, FULL),        # row - 1
+    (9, NOT_COL_7),   # row - 1, col - 1
+    (7, NOT_COL_0),   # row - 1, col + 1
+]
+
+POSITION_VALUES = [
+    [1.00, 0.20, 0.70, 0.60, 0.60, 0.70, 0.20, 1.00],
+    [0.20, 0.10, 0.55, 0.50, 0.50, 0.55, 0.10, 0.20],
+    [0.70, 0.55, 0.60, 0.55, 0.55, 0.60, 0.55, 0.70],
+    [0.60, 0.50, 0.55, 0.50, 0.50, 0.55, 0.50, 0.60],
+    [0.60, 0.50, 0.55, 0.50, 0.50, 0.55, 0.50, 0.60],
+    [0.70, 0.55, 0.60, 0.55, 0.55, 0.60, 0.55, 0.70],
+    [0.20, 0.10, 0.55, 0.50, 0.50, 0.55, 0.10, 0.20],
+    [1.00, 0.20, 0.70, 0.60, 0.60, 0.70, 0.20, 1.00]
+]
+
+POSITION_VALUES2 = [
+    [100, -15, 55, 40, 40, 55, -15, 100],
+    [-15, -35, -20, 5, 5, -20, -35, -15],
+    [55, -20, 10, 10, 10, 10, -20, 55],
+    [40, 5, 10, -15, -15, 10, 5, 40],
+    [40, 5, 10, -15, -15, 10, 5, 40],
+    [55, -20, 10, 10, 10, 10, -20, 55],
+    [-15, -35, -20, 5, 5, -20, -35, -15],
+    [100, -15, 55, 40, 40, 55, -15, 100]
+]
+
+
+def build_row_tables(table):
+    '''
+        For every row, precompute the sum of table values for each of the 256
+        possible occupancy bytes of that row.
+    '''
+    row_tables = []
+    for row in table:
+        sums = []
+        for byte in range(256):
+            sums.append(sum(row[col] for col in range(8) if byte >> col & 1))
+        row_tables.append(sums)
+    return row_tables
+
+
+# POSITION_VALUES in hundredths, so running sums stay exact integers
+POSITION_VALUES_X100 = [[round(value * 100) for value in row] for row in POSITION_VALUES]
+POSITION_ROW_TABLES = build_row_tables(POSITION_VALUES_X100)
+
+# Per-square versions of the tables, indexed by row * 8 + col
+SQUARE_VALUES = [value for row in POSITION_VALUES_X100 for value in row]
+SQUARE_VALUES2 = [value for row in POSITION_VALUES2 for value in row]
+
+
+def popcount(bits):
+    return bits.bit_count()
+
+
+def weighted_sum(bits, row_tables):
+    '''Sum a positional table over the set bits, one lookup per row'''
+    return row_tables[0][bits & 0xFF] + \
+           row_tables[1][bits >> 8 & 0xFF] + \
+           row_tables[2][bits >> 16 & 0xFF] + \
+           row_tables[3][bits >> 24 & 0xFF] + \
+           row_tables[4][bits >> 32 & 0xFF] + \
+           row_tables[5][bits >> 40 & 0xFF] + \
+           row_tables[6][bits >> 48 & 0xFF] + \
+           row_tables[7][bits >> 56]
+
+
+def get_moves(own, opp):
+    '''
+        Return a mask of every empty square where "own" would capture at least
+        one of "opp"'s stones. Each direction walks runs of opponent stones out
+        from our stones; a run that ends on an empty square is a move.
+    '''
+    empty = ~(own | opp) & FULL
+    moves = 0
+    for shift, mask in LEFT_SHIFTS:
+        opp_mask = opp & mask
+        x = (own << shift) & opp_mask
+        x |= (x << shift) & opp_mask
+        x |= (x << shift) & opp_mask
+        x |= (x << shift) & opp_mask
+        x |= (x << shift) & opp_mask
+        x |= (x << shift) & opp_mask
+        moves |= (x << shift) & mask & empty
+    for shift, mask in RIGHT_SHIFTS:
+        opp_mask = opp & mask
+        x = (own >> shift) & opp_mask
+        x |= (x >> shift) & opp_mask
+        x |= (x >> shift) & opp_mask
+        x |= (x >> shift) & opp_mask
+        x |= (x >> shift) & opp_mask
+        x |= (x >> shift) & opp_mask
+        moves |= (x >> shift) & mask & empty
+    return moves
+
+
+def get_flips(own, opp, move_bit):
+    '''Return the mask of "opp" stones flipped when "own" plays on move_bit'''
+    flips = 0
+    for shift, mask in LEFT_SHIFTS:
+        line = 0
+        x = (move_bit << shift) & mask
+        while x & opp:
+            line |= x
+            x = (x << shift) & mask
+        if x & own:
+            flips |= line
+    for shift, mask in RIGHT_SHIFTS:
+        line = 0
+        x = (move_bit >> shift) & mask
+        while x & opp:
+            line |= x
+            x = (x >> shift) & mask
+        if x & own:
+            flips |= line
+    return flips
+
+
+def build_diagonals(step):
+    '''
+        Masks of the diagonals running in direction step (9 for row + 1,
+        col + 1, 7 for row + 1, col - 1) that are at least 3 squares long.
+        Shorter diagonals only hold edge squares.
+    '''
+    lines = []
+    starts = [(0, col) for col in range(8)] + [(row, 0 if step == 9 else 7) for row in range(1, 8)]
+    for row, col in starts:
+        line = 0
+        while 0 <= row < 8 and 0 <= col < 8:
+            line |= 1 << (row * 8 + col)
+            row += 1
+            col += 1 if step == 9 else -1
+        if popcount(line) >= 3:
+            lines.append(line)
+    return lines
+
+
+DIAGONALS_9 = build_diagonals(9)
+DIAGONALS_7 = build_diagonals(7)
+
+
+def full_rows(occupied):
+    '''Mask of the rows with no empty square'''
+    # Fold each row into its column 0 bit
+    rows = occupied & (occupied >> 1)
+    rows &= rows >> 2
+    rows &= rows >> 4
+    return (rows & COL_0) * 0xFF
+
+
+def full_columns(occupied):
+    '''Mask of the columns with no empty square'''
+    # Fold each column into its row 0 bit
+    cols = occupied & (occupied >> 32)
+    cols &= cols >> 16
+    cols &= cols >> 8
+    return (cols & 0xFF) * COL_0
+
+
+def full_diagonals(occupied, lines):
+    full = 0
+    for line in lines:
+        if occupied & line == line:
+            full |= line
+    return full
+
+
+def stability_anchors(occupied):
+    '''
+        For each of the four directions (horizontal, vertical, diagonal 9,
+        diagonal 7), the squares that cannot be flipped along it whatever
+        their neighbours: edge squares and squares on a full line. None if
+        no stone on the board can be stable.
+    '''
+    horizontal = full_rows(occupied)
+    vertical = full_columns(occupied)
+    # Without a corner, stability has to start from a full row or column
+    if not (occupied & CORNERS or horizontal or vertical):
+        return None
+    return (horizontal | COL_0 | COL_7,
+            vertical | ROW_0 | ROW_7,
+            full_diagonals(occupied, DIAGONALS_9) | EDGES,
+            full_diagonals(occupied, DIAGONALS_7) | EDGES)
+
+
+def grow_stable(own, anchors):
+    '''
+        Grow the stable "own" stones out from the anchors. A stone is stable
+        when, along each of the four lines through it, it is anchored or
+        next to a stable stone of its own colour. Repeats until nothing
+        changes, which is a few rounds on real boards.
+    '''
+    horizontal, vertical, diagonal_9, diagonal_7 = anchors
+    stable = 0
+    while True:
+        grown = own & \
+            (horizontal | ((stable << 1) & NOT_COL_0) | ((stable >> 1) & NOT_COL_7)) & \
+            (vertical | ((stable << 8) & FULL) | (stable >> 8)) & \
+            (diagonal_9 | ((stable << 9) & NOT_COL_0) | ((stable >> 9) & NOT_COL_7)) & \
+            (diagonal_7 | ((stable << 7) & NOT_COL_7) | ((stable >> 7) & NOT_COL_0))
+        if grown == stable:
+            return stable
+        stable = grown
+
+
+def stable_discs(own, opp):
+    '''
+        Return the mask of "own" stones that can never be flipped. This can
+        miss a few unusual stable stones, but every stone in it is stable.
+    '''
+    anchors = stability_anchors(own | opp)
+    if anchors is None:
+        return 0
+    return grow_stable(own, anchors)
+
+
+def stability(own, opp):
+    '''Stable stone difference scaled to [-100, 100], like coin parity'''
+    anchors = stability_anchors(own | opp)
+    if anchors is None:
+        return 0
+    own_stable = popcount(grow_stable(own, anchors))
+    opp_stable = popcount(grow_stable(opp, anchors))
+    if own_stable + opp_stable == 0:
+        return 0
+    return 100 * (own_stable - opp_stable) / (own_stable + opp_stable)
+
+
+def touching_empty(empty):
+    '''Return the mask of squares next to at least one square in "empty"'''
+    return ((empty << 1) & NOT_COL_0) | ((empty >> 1) & NOT_COL_7) | \
+           ((empty << 8) & FULL) | (empty >> 8) | \
+           ((empty << 9) & NOT_COL_0) | ((empty >> 9) & NOT_COL_7) | \
+           ((empty << 7) & NOT_COL_7) | ((empty >> 7) & NOT_COL_0)
+
+
+def get_frontier(own, opp):
+    '''Return the mask of "own" stones that touch at least one empty square'''
+    return own & touching_empty(~(own | opp) & FULL)
+
+
+def build_neighbors():
+    '''For every square, the mask of the up to 8 squares around it'''
+    neighbors = []
+    for square in range(64):
+        bit = 1 << square
+        near = 0
+        for shift, mask in LEFT_SHIFTS:
+            near |= (bit << shift) & mask
+        for shift, mask in RIGHT_SHIFTS:
+            near |= (bit >> shift) & mask
+        neighbors.append(near)
+    return neighbors
+
+
+NEIGHBORS = build_neighbors()
+
+
+def iter_squares(bits):
+    '''Yield the (row, col) of every set bit, lowest square first'''
+    while bits:
+        low_bit = bits & -bits
+        square = low_bit.bit_length() - 1
+        yield (square >> 3, square & 7)
+        bits ^= low_bit
+
+
+def board_to_bits(board, player):
+    bits = 0
+    for square in np.flatnonzero(np.asarray(board).ravel() == player):
+        bits |= 1 << int(square)
+    return bits
+
+
+def bits_to_board(pieces):
+    board = np.zeros(64, dtype=int)
+    for player in (1, 2):
+        bits = pieces[player]
+        while bits:
+            low_bit = bits & -bits
+            board[low_bit.bit_length() - 1] = player
+            bits ^= low_bit
+    return board.reshape(8, 8)
+
+
+class BitboardGameState:
+    '''
+        Drop-in replacement for ReversiGameState that stores the board as two
+        64-bit masks. pieces[1] and pieces[2] hold the stones of player 1 and
+        player 2 (pieces[0] is unused so a player number can index it).
+        "hash" is the Zobrist hash of the position, kept up to date by
+        simulate_move, make_move and change_turn.
+
+        make_move/unmake_move play and take back moves in place for search,
+        remembering the square, flipped stones and hash of each move on a
+        fixed-size undo stack.
+
+        The evaluation terms are kept up to date as stones are placed and
+        flipped, so get_score never has to scan the board. Each is a list
+        indexed by player: piece counts, position_values sums (in
+        hundredths), corners held and frontier discs. Stability is not
+        incremental: a move can make stones far away stable.
+
+        An evaluator can also attach pattern indices (see PatternEvaluator):
+        pattern_indices holds one base-3 index per pattern instance and
+        pattern_updates lists the (instance, power of 3) pairs each square
+        contributes to, so place() can keep the indices current too.
+    '''
+    def __init__(self, pieces, turn, w_1, w_2, w_3, w_4, w_5, w_6, w_7, hash=None):
+        self.board_dim = 8
+        self.pieces = pieces
+        self.turn = turn
+        self.hash = zobrist_hash(pieces, turn) if hash is None else hash
+        self.w_1 = w_1
+        self.w_2 = w_2
+        self.w_3 = w_3
+        self.w_4 = w_4
+        self.w_5 = w_5
+        self.w_6 = w_6
+        self.w_7 = w_7
+        self.undo_squares = [0] * UNDO_STACK_SIZE
+        self.undo_flips = [0] * UNDO_STACK_SIZE
+        self.undo_hashes = [0] * UNDO_STACK_SIZE
+        self.undo_terms = [None] * UNDO_STACK_SIZE
+        self.undo_patterns = [None] * UNDO_STACK_SIZE
+        self.undo_top = 0
+        self.pattern_indices = None
+        self.pattern_updates = None
+        self.init_terms()
+
+    def init_terms(self):
+        '''Compute the running evaluation terms from scratch'''
+        p1 = self.pieces[1]
+        p2 = self.pieces[2]
+        frontier = get_frontier(p1, p2) | get_frontier(p2, p1)
+        self.counts = [0, popcount(p1), popcount(p2)]
+        self.positional = [0, weighted_sum(p1, POSITION_ROW_TABLES), weighted_sum(p2, POSITION_ROW_TABLES)]
+        self.corners = [0, popcount(p1 & CORNERS), popcount(p2 & CORNERS)]
+        self.frontier = [0, popcount(p1 & frontier), popcount(p2 & frontier)]
+
+    @classmethod
+    def from_state(cls, state):
+        '''Build a bitboard copy of a ReversiGameState'''
+        pieces = [0, board_to_bits(state.board, 1), board_to_bits(state.board, 2)]
+        return cls(pieces, state.turn, state.w_1, state.w_2, state.w_3, state.w_4, state.w_5, state.w_6, state.w_7)
+
+    @property
+    def weights(self):
+        return (self.w_1, self.w_2, self.w_3, self.w_4, self.w_5, self.w_6, self.w_7)
+
+    @weights.setter
+    def weights(self, weights):
+        # Kept as attributes here, since get_score reads them at every leaf
+        self.w_1, self.w_2, self.w_3, self.w_4, self.w_5, self.w_6, self.w_7 = weights
+
+    @property
+    def board(self):
+        '''8x8 NumPy view of the board, for code that still expects one'''
+        return bits_to_board(self.pieces)
+
+    def clone_state(self):
+        clone = BitboardGameState(list(self.pieces), self.turn, self.w_1, self.w_2, self.w_3, self.w_4, self.w_5, self.w_6, self.w_7, self.hash)
+        if self.pattern_indices is not None:
+            clone.pattern_indices = list(self.pattern_indices)
+            clone.pattern_updates = self.pattern_updates
+        return clone
+
+    def place(self, square):
+        '''
+            Put a stone for the side to move on square, flip, update the hash
+            and evaluation terms from the changed squares, and return the flips
+        '''
+        turn = self.turn
+        other = 3 - turn
+        move_bit = 1 << square
+        own = self.pieces[turn]
+        opp = self.pieces[other]
+        flips = get_flips(own, opp, move_bit)
+        new_own = own | move_bit | flips
+        new_opp = opp ^ flips
+        self.pieces[turn] = new_own
+        self.pieces[other] = new_opp
+        near = NEIGHBORS[square]
+
+        key = self.hash ^ ZOBRIST_PIECES[turn][square]
+        flip_count = 0
+        flip_positional = 0
+        indices = self.pattern_indices
+        if indices is not None:
+            updates = self.pattern_updates
+            for instance, power in updates[square]:
+                indices[instance] += turn * power
+            # A flipped square's digit goes from "other" to "turn"
+            flip_digit = turn - other
+        remaining = flips
+        while remaining:
+            low_bit = remaining & -remaining
+            flipped = low_bit.bit_length() - 1
+            key ^= ZOBRIST_FLIP[flipped]
+            flip_count += 1
+            flip_positional += SQUARE_VALUES[flipped]
+            if indices is not None:
+                for instance, power in updates[flipped]:
+                    indices[instance] += flip_digit * power
+            remaining ^= low_bit
+        self.hash = key
+
+        # Frontier status can only change on the new stone, its neighbours
+        # (which all touched the square we just filled) and flipped stones
+        # (which change sides)
+        touching = touching_empty(~(new_own | new_opp) & FULL)
+        changed = near | move_bit | flips
+        frontier = self.frontier
+        frontier[turn] += popcount(new_own & changed & touching) - popcount(own & near)
+        frontier[other] += popcount(new_opp & changed & touching) - popcount(opp & near) - \
+            popcount(flips & ~near & touching)
+
+        self.counts[turn] += 1 + flip_count
+        self.counts[other] -= flip_count
+        self.positional[turn] += SQUARE_VALUES[square] + flip_positional
+        self.positional[other] -= flip_positional
+        if move_bit & CORNERS:
+            self.corners[turn] += 1
+        return flips
+
+    def simulate_move(self, move):
+        self.place(move[0] * 8 + move[1])
+        return self.get_score(self.turn)
+
+    def make_move(self, move):
+        '''Play move (None to pass) in place and hand the turn to the opponent'''
+        top = self.undo_top
+        self.undo_hashes[top] = self.hash
+        self.undo_terms[top] = (self.counts[1], self.counts[2], self.positional[1], self.positional[2],
+                                self.corners[1], self.corners[2], self.frontier[1], self.frontier[2])
+        if self.pattern_indices is not None:
+            self.undo_patterns[top] = list(self.pattern_indices)
+        if move is None:
+            self.undo_squares[top] = -1
+            self.undo_flips[top] = 0
+        else:
+            square = move[0] * 8 + move[1]
+            self.undo_squares[top] = square
+            self.undo_flips[top] = self.place(square)
+        self.undo_top = top + 1
+        self.turn = 3 - self.turn
+        self.hash ^= ZOBRIST_TURN
+
+    def unmake_move(self):
+        '''Take back the last make_move'''
+        top = self.undo_top - 1
+        self.undo_top = top
+        self.turn = 3 - self.turn
+        square = self.undo_squares[top]
+        if square >= 0:
+            flips = self.undo_flips[top]
+            self.pieces[self.turn] ^= flips | (1 << square)
+            self.pieces[3 - self.turn] |= flips
+            (self.counts[1], self.counts[2], self.positional[1], self.positional[2],
+             self.corners[1], self.corners[2], self.frontier[1], self.frontier[2]) = self.undo_terms[top]
+            if self.pattern_indices is not None:
+                self.pattern_indices = self.undo_patterns[top]
+        self.hash = self.undo_hashes[top]
+
+    def get_score(self, turn):
+        return self.w_1 * self.coin_parity(turn) + \
+               self.w_2 * self.mobility(turn) + \
+               self.w_3 * self.corners_captured(turn) + \
+               self.w_4 * self.get_stability(turn) + \
+               self.w_5 * self.get_positional_weight(turn) + \
+               self.w_6 * self.get_random_weight() + \
+               self.w_7 * self.frontier_discs(turn)
+
+    def get_piece_count(self, player):
+        return self.counts[player]
+
+    def coin_parity(self, player):
+        if(self.w_1 < 0.2):
+            return 0
+        own = self.counts[player]
+        opp = self.counts[3 - player]
+        return 100 * (own - opp) / (own + opp)
+
+    def mobility(self, player):
+        if(self.w_2 < 0.2):
+            return 0
+        return 100 * popcount(self.get_move_mask(player)) / (self.board_dim * self.board_dim)
+
+    def corners_captured(self, player):
+        if(self.w_3 < 0.2):
+            return 0
+        return 25 * self.corners[player]
+
+    def get_stability(self, player):
+        if self.w_4 < 0.2:
+            return 0
+        return stability(self.pieces[player], self.pieces[3 - player])
+
+    def get_positional_weight(self, turn):
+        if(self.w_5 < 0.1):
+            return 0
+        return self.positional[turn] / 10000
+
+    def get_random_weight(self):
+        if(self.w_6 < 0.1):
+            return 0
+        return random.uniform(0, 100)
+
+    def frontier_discs(self, player):
+        if self.w_7 < 0.1:
+            return 0
+        return self.frontier[player] * 2
+
+    def change_turn(self):
+        self.turn = 3 - self.turn
+        self.hash ^= ZOBRIST_TURN
+        return self.turn
+
+    def space_is_on_board(self, row, col):
+        return 0 <= row < self.board_dim and 0 <= col < self.board_dim
+
+    def space_is_unoccupied(self, row, col):
+        return not (self.pieces[1] | self.pieces[2]) >> (row * 8 + col) & 1
+
+    def space_is_available(self, row, col):
+        return self.space_is_on_board(row, col) and \
+               self.space_is_unoccupied(row, col)
+
+    def is_valid_move(self, row, col):
+        return self.space_is_on_board(row, col) and \
+               bool(self.get_move_mask() >> (row * 8 + col) & 1)
+
+    def get_move_mask(self, player=None):
+        '''Mask of valid moves for player, by default the side to move'''
+        if player is None:
+            player = self.turn
+        # Until the middle four squares are filled they are the only moves
+        empty_center = CENTER & ~(self.pieces[1] | self.pieces[2])
+        if empty_center:
+            return empty_center
+        return get_moves(self.pieces[player], self.pieces[3 - player])
+
+    def get_valid_moves(self):
+        return list(iter_squares(self.get_move_mask()))
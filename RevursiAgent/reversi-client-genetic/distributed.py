@@ -0,0 +1,246 @@
+import collections
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+from genetic_trainer import GeneticTrainer
+
+# Coordinator/worker mode for GeneticTrainer. The coordinator runs inside the
+# trainer and hands out match jobs over TCP; workers on any host connect,
+# play the jobs with ReversiBot and send back the scores. Every message is
+# one line of JSON, and the worker always speaks first:
+#     {"type": "get"}                        -> {"type": "job", "id": 7, "games": 6, "early_stopping": true,
+#                                                 "opening_plies": 4, "match": [seed, w1, w2, d1, d2]}
+#                                               or {"type": "wait", "seconds": 0.5}
+#     {"type": "heartbeat", "id": 7}         -> {"type": "ok"}
+#     {"type": "result", "id": 7, "score": 1} -> {"type": "ok"}
+#     {"type": "failed", "id": 7, "error": "..."} -> {"type": "ok"}
+# A job goes back on the queue when its worker disconnects or hasn't sent a
+# heartbeat for heartbeat_timeout seconds, or when playing it raised an
+# exception. A job that fails max_attempts times fails the whole round, as it
+# would when playing locally. If two workers end up playing the same job the
+# first result wins.
+
+DEFAULT_PORT = 4700
+
+
+class MatchCoordinator:
+    '''
+        Job queue and TCP server for match workers. Give it to
+        GeneticTrainer(coordinator=...) and the tournament's matches are
+        played by whatever workers are connected.
+    '''
+    def __init__(self, host='0.0.0.0', port=DEFAULT_PORT, heartbeat_timeout=30.0, max_attempts=3):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.condition = threading.Condition()
+        self.pending = collections.deque()
+        # job id -> (games per match, early stopping, opening plies, match)
+        self.jobs = {}
+        # job id -> (connection, time last heard from)
+        self.assigned = {}
+        self.results = {}
+        # job id -> number of failed attempts, and the error of jobs out of attempts
+        self.attempts = {}
+        self.errors = {}
+        self.next_id = 0
+
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                coordinator.serve(self.rfile, self.wfile, self)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_jobs(self, matches, games_per_match, early_stopping=True, opening_plies=4):
+        '''
+            Queue (seed, bot1 weights, bot2 weights, bot1 depth, bot2 depth)
+            matches, wait for all of them and return bot 1's scores in order.
+            Raises RuntimeError if a match fails max_attempts times.
+        '''
+        with self.condition:
+            ids = []
+            for match in matches:
+                self.jobs[self.next_id] = (games_per_match, early_stopping, opening_plies, match)
+                self.pending.append(self.next_id)
+                ids.append(self.next_id)
+                self.next_id += 1
+            while any(job not in self.results for job in ids) and not any(job in self.errors for job in ids):
+                self.condition.wait(timeout=1.0)
+                self.requeue_stale()
+            scores = [self.results.pop(job, None) for job in ids]
+            errors = [self.errors.pop(job) for job in ids if job in self.errors]
+            # Jobs left on the queue are skipped once they are gone from jobs
+            for job in ids:
+                del self.jobs[job]
+                self.attempts.pop(job, None)
+                self.assigned.pop(job, None)
+            if errors:
+                raise RuntimeError(f"match failed {self.max_attempts} times: {errors[0]}")
+            return scores
+
+    def requeue_stale(self):
+        '''Put back jobs whose worker has gone quiet. Call with the lock held.'''
+        now = time.monotonic()
+        for job, (connection, heard) in list(self.assigned.items()):
+            if now - heard > self.heartbeat_timeout:
+                del self.assigned[job]
+                self.pending.appendleft(job)
+
+    def requeue_connection(self, connection):
+        with self.condition:
+            for job, (holder, _) in list(self.assigned.items()):
+                if holder is connection:
+                    del self.assigned[job]
+                    self.pending.appendleft(job)
+            self.condition.notify_all()
+
+    def serve(self, rfile, wfile, connection):
+        '''Answer one worker's messages until it disconnects'''
+        try:
+            for line in rfile:
+                reply = self.handle_message(json.loads(line), connection)
+                wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+                wfile.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.requeue_connection(connection)
+
+    def handle_message(self, message, connection):
+        with self.condition:
+            if message['type'] == 'get':
+                while self.pending:
+                    job = self.pending.popleft()
+                    # Skip jobs finished by another worker after being requeued
+                    if job in self.jobs and job not in self.results:
+                        self.assigned[job] = (connection, time.monotonic())
+                        games_per_match, early_stopping, opening_plies, match = self.jobs[job]
+                        return {'type': 'job', 'id': job, 'games': games_per_match,
+                                'early_stopping': early_stopping, 'opening_plies': opening_plies, 'match': match}
+                return {'type': 'wait', 'seconds': 0.5}
+
+            job = message['id']
+            if message['type'] == 'heartbeat':
+                if job in self.assigned and self.assigned[job][0] is connection:
+                    self.assigned[job] = (connection, time.monotonic())
+            elif message['type'] == 'result':
+                if job in self.jobs and job not in self.results:
+                    self.results[job] = message['score']
+                self.assigned.pop(job, None)
+                self.condition.notify_all()
+            elif message['type'] == 'failed':
+                if job in self.jobs and job not in self.results and job not in self.errors:
+                    self.attempts[job] = self.attempts.get(job, 0) + 1
+                    if self.attempts[job] >= self.max_attempts:
+                        self.errors[job] = message['error']
+                    else:
+                        self.pending.appendleft(job)
+                self.assigned.pop(job, None)
+                self.condition.notify_all()
+            return {'type': 'ok'}
+
+
+class MatchWorker:
+    '''
+        Connects to a MatchCoordinator and plays jobs until stopped,
+        reconnecting if the connection drops. While a match is being played
+        a background thread sends a heartbeat every heartbeat_interval
+        seconds.
+    '''
+    def __init__(self, host, port=DEFAULT_PORT, heartbeat_interval=5.0, retry_delay=2.0):
+        self.host = host
+        self.port = port
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        self.trainers = {}
+        self.stopped = False
+
+    def request(self, message):
+        '''Send one message and return the reply; safe to call from two threads'''
+        with self.lock:
+            self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+            self.wfile.flush()
+            line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("coordinator closed the connection")
+        return json.loads(line)
+
+    def trainer(self, games_per_match, early_stopping, opening_plies):
+        '''A headless trainer with no population, used only to play matches'''
+        key = (games_per_match, early_stopping, opening_plies)
+        if key not in self.trainers:
+            self.trainers[key] = GeneticTrainer(0, games_per_match, headless=True, early_stopping=early_stopping,
+                                                opening_plies=opening_plies)
+        return self.trainers[key]
+
+    def heartbeat(self, job, done):
+        while not done.wait(self.heartbeat_interval):
+            try:
+                self.request({'type': 'heartbeat', 'id': job})
+            except (OSError, ValueError):
+                return
+
+    def play(self):
+        '''Play jobs on one connection until it fails'''
+        while not self.stopped:
+            reply = self.request({'type': 'get'})
+            if reply['type'] == 'wait':
+                time.sleep(reply['seconds'])
+                continue
+            done = threading.Event()
+            beat = threading.Thread(target=self.heartbeat, args=(reply['id'], done), daemon=True)
+            beat.start()
+            try:
+                trainer = self.trainer(reply['games'], reply.get('early_stopping', False), reply.get('opening_plies', 0))
+                score = trainer.play_seeded(*reply['match'])
+            except Exception as e:
+                # Report it and carry on with the next job; the coordinator
+                # requeues this one
+                print(f"Match {reply['id']} failed: {e!r}")
+                score = None
+                error = repr(e)
+            finally:
+                done.set()
+                beat.join()
+            if score is None:
+                self.request({'type': 'failed', 'id': reply['id'], 'error': error})
+            else:
+                self.request({'type': 'result', 'id': reply['id'], 'score': score})
+
+    def run(self):
+        while not self.stopped:
+            try:
+                with socket.create_connection((self.host, self.port)) as sock:
+                    self.rfile = sock.makefile('rb')
+                    self.wfile = sock.makefile('wb')
+                    self.play()
+            except (OSError, ValueError) as e:
+                print(f"Lost the coordinator ({e}), retrying in {self.retry_delay}s")
+                time.sleep(self.retry_delay)
+
+
+if __name__ == "__main__":
+    # python distributed.py coordinator <port> <population size> <generations> [checkpoint file]
+    # python distributed.py worker <coordinator host> <port>
+    if sys.argv[1] == 'coordinator':
+        coordinator = MatchCoordinator(port=int(sys.argv[2]))
+        file_name = sys.argv[5] if len(sys.argv) > 5 else None
+        trainer = GeneticTrainer(int(sys.argv[3]), 6, headless=True, coordinator=coordinator, file_name=file_name)
+        trainer.evolve(generations=int(sys.argv[4]))
+        coordinator.close()
+    else:
+        MatchWorker(sys.argv[2], int(sys.argv[3])).run()
@@ -0,0 +1,160 @@
+import time
+from bitboard import FULL, CORNERS, get_moves, get_flips, popcount
+from time_manager import SearchTimeout
+
+# Quadrants of the board, used for parity ordering
+QUADRANTS = [
+    0x000000000F0F0F0F,  # rows 0-3, cols 0-3
+    0x00000000F0F0F0F0,  # rows 0-3, cols 4-7
+    0x0F0F0F0F00000000,  # rows 4-7, cols 0-3
+    0xF0F0F0F000000000,  # rows 4-7, cols 4-7
+]
+
+# Below this many empties moves are ordered by parity alone, and at or
+# below SHALLOW_EMPTIES empty squares are tried directly without move
+# generation
+FASTEST_FIRST_EMPTIES = 7
+SHALLOW_EMPTIES = 4
+
+
+class EndgameSolver:
+    '''
+        Plays the game out to the end and returns exact results. Scores are
+        the final disc differential (our discs minus theirs) for the player
+        to move, searched with negamax alpha-beta directly on the two bit
+        masks. Moves are ordered fastest-first (fewest replies for the
+        opponent) while many squares are empty, then by parity: squares in
+        quadrants with an odd number of empties first, so we tend to get the
+        last move in each region.
+    '''
+    def __init__(self, empties_threshold=12, deadline=None):
+        # ReversiBot switches to the solver at this many empty squares
+        self.empties_threshold = empties_threshold
+        self.deadline = deadline
+        self.nodes = 0
+
+    def solve(self, state):
+        '''
+            Return (best move, exact final disc differential for the player to
+            move) for a BitboardGameState, or (None, score) without moves
+        '''
+        own = state.pieces[state.turn]
+        opp = state.pieces[3 - state.turn]
+        moves = get_moves(own, opp)
+        if not moves:
+            return None, self.negamax(own, opp, -64, 64)
+
+        best_move = None
+        best_score = -65
+        alpha = -64
+        for move_bit in self.order(own, opp, moves):
+            flips = get_flips(own, opp, move_bit)
+            score = -self.negamax(opp ^ flips, own | move_bit | flips, -64, -alpha)
+            if score > best_score:
+                best_score = score
+                best_move = move_bit
+                alpha = max(alpha, score)
+        square = best_move.bit_length() - 1
+        return (square >> 3, square & 7), best_score
+
+    def negamax(self, own, opp, alpha, beta):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        empty = ~(own | opp) & FULL
+        empties = popcount(empty)
+        if empties <= SHALLOW_EMPTIES:
+            return self.shallow(own, opp, empty, empties, alpha, beta, False)
+
+        moves = get_moves(own, opp)
+        if not moves:
+            if not get_moves(opp, own):
+                return popcount(own) - popcount(opp)
+            return -self.negamax(opp, own, -beta, -alpha)
+
+        best_score = -65
+        for move_bit in self.order(own, opp, moves):
+            flips = get_flips(own, opp, move_bit)
+            score = -self.negamax(opp ^ flips, own | move_bit | flips, -beta, -alpha)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def shallow(self, own, opp, empty, empties, alpha, beta, passed):
+        '''
+            Search the last few empties by trying each empty square directly:
+            a square is a legal move exactly when it flips something, so no
+            move generation is needed
+        '''
+        if empties == 0:
+            return popcount(own) - popcount(opp)
+        if empties == 1:
+            return self.last_move(own, opp, empty)
+        best_score = -65
+        for move_bit in self.parity_order(empty):
+            flips = get_flips(own, opp, move_bit)
+            if not flips:
+                continue
+            self.nodes += 1
+            score = -self.shallow(opp ^ flips, own | move_bit | flips, empty ^ move_bit, empties - 1,
+                                  -beta, -alpha, False)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best_score == -65:
+            # No legal move: the opponent moves, or the game is over
+            if passed:
+                return popcount(own) - popcount(opp)
+            return -self.shallow(opp, own, empty, empties, -beta, -alpha, True)
+        return best_score
+
+    def last_move(self, own, opp, empty):
+        '''Exact score with one empty square left'''
+        difference = popcount(own) - popcount(opp)
+        flips = get_flips(own, opp, empty)
+        if flips:
+            return difference + 1 + 2 * popcount(flips)
+        flips = get_flips(opp, own, empty)
+        if flips:
+            return difference - 1 - 2 * popcount(flips)
+        return difference
+
+    def order(self, own, opp, moves):
+        if popcount(moves) < 2:
+            return [moves] if moves else []
+        empty = ~(own | opp) & FULL
+        if popcount(empty) < FASTEST_FIRST_EMPTIES:
+            return [bit for bit in self.parity_order(empty) if bit & moves]
+
+        scored = []
+        while moves:
+            move_bit = moves & -moves
+            flips = get_flips(own, opp, move_bit)
+            new_own = own | move_bit | flips
+            new_opp = opp ^ flips
+            # Fewest opponent replies first, a corner counts as two fewer
+            scored.append((popcount(get_moves(new_opp, new_own)) - (2 if move_bit & CORNERS else 0), move_bit))
+            moves ^= move_bit
+        scored.sort()
+        return [move_bit for _, move_bit in scored]
+
+    def parity_order(self, empty):
+        '''Empty squares, those in quadrants with an odd number of empties first'''
+        odd = []
+        even = []
+        for quadrant in QUADRANTS:
+            region = empty & quadrant
+            squares = odd if popcount(region) & 1 else even
+            while region:
+                bit = region & -region
+                squares.append(bit)
+                region ^= bit
+        return odd + even
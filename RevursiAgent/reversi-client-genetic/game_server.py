@@ -0,0 +1,175 @@
+import asyncio
+import json
+import sys
+import time
+import numpy as np
+from bitboard import BitboardGameState
+
+# Headless stand-in for the Java ReversiServer, for load testing clients.
+# It speaks the same line protocol: on connect "<player> <minutes>", then for
+# each turn the mover gets "<player>\n<round>\n<t1>\n<t2>\n" and the 64
+# squares (server rows, row 0 first) followed by a blank line, and answers
+# "<row>\n<col>\n". After every move both players get the same message with
+# a turn of 1 - player. At the end both get "-999" and then the winner, both
+# clocks and the final board. Like the Java server a player with no moves
+# passes, an invalid move is answered by sending the state again, and
+# running out of time loses the game.
+#
+# With pace=True the server also sleeps where the Java server does (10ms
+# after each move, counted against the mover's clock, and 50ms after the
+# updates). The blocking ReversiServerConnection reads a message with one
+# recv and relies on that gap; clients with proper framing can be tested
+# with pace=False.
+#
+# Game g listens for its players on port_base + 2 * g + 1 and + 2, so game 0
+# uses the Java server's ports 3334 and 3335. Any number of games run at
+# once, and the time from sending each move request to receiving the move is
+# recorded.
+
+
+def state_message(turn, round, t1, t2, state):
+    # The server's row 0 is the client's row 7
+    cells = ''.join(f"{cell}\n" for cell in np.flip(state.board, 0).ravel())
+    return f"{turn}\n{round}\n{t1}\n{t2}\n{cells}\n"
+
+
+async def accept_players(host, port_base):
+    '''Wait for both players of one game and return {player: (reader, writer)}'''
+    players = {}
+    both_connected = asyncio.Event()
+
+    async def connected(player, reader, writer):
+        players[player] = (reader, writer)
+        if len(players) == 2:
+            both_connected.set()
+
+    servers = []
+    for player in (1, 2):
+        servers.append(await asyncio.start_server(
+            lambda reader, writer, player=player: connected(player, reader, writer), host, port_base + player))
+    await both_connected.wait()
+    for server in servers:
+        server.close()
+    return players
+
+
+async def send(writer, message):
+    writer.write(message.encode('utf-8'))
+    await writer.drain()
+
+
+async def play_game(host, port_base, minutes=3, pace=True):
+    '''
+        Run one game and return its result: winner (0 for a draw), final
+        disc counts, both clocks, and the seconds each move request took
+    '''
+    players = await accept_players(host, port_base)
+    for player, (_, writer) in players.items():
+        await send(writer, f"{player} {minutes}\n")
+
+    state = BitboardGameState([0, 0, 0], 1, 0, 0, 0, 0, 0, 0, 0)
+    clocks = {1: minutes * 60.0, 2: minutes * 60.0}
+    latencies = []
+    round = 0
+    passes = 0
+    timed_out = None
+    try:
+        while passes < 2:
+            player = state.turn
+            valid_moves = state.get_valid_moves()
+            if not valid_moves:
+                passes += 1
+                state.make_move(None)
+                continue
+            passes = 0
+
+            reader, writer = players[player]
+            started = time.perf_counter()
+            move = None
+            while move not in valid_moves:
+                await send(writer, state_message(player, round, clocks[1], clocks[2], state))
+                requested = time.perf_counter()
+                row = int(await reader.readline())
+                col = int(await reader.readline())
+                latencies.append(time.perf_counter() - requested)
+                move = (7 - row, col)
+            if pace:
+                await asyncio.sleep(0.01)
+            clocks[player] -= time.perf_counter() - started
+            if clocks[player] <= 0:
+                timed_out = player
+                break
+
+            state.make_move(move)
+            round += 1
+            for other, (_, other_writer) in players.items():
+                await send(other_writer, state_message(1 - other, round, clocks[1], clocks[2], state))
+            if pace:
+                await asyncio.sleep(0.05)
+    finally:
+        for _, writer in players.values():
+            try:
+                await send(writer, "-999\n")
+            except OSError:
+                pass
+
+    black = state.get_piece_count(1)
+    white = state.get_piece_count(2)
+    if timed_out is not None:
+        winner = 3 - timed_out
+        clocks[timed_out] = 0.0
+    else:
+        winner = 1 if black > white else 2 if white > black else 0
+    board = np.flip(state.board, 0)
+    if timed_out is None and winner:
+        # Like the Java server, empty squares go to the winner
+        board[board == 0] = winner
+    cells = ''.join(f"{cell}\n" for cell in board.ravel())
+    for _, writer in players.values():
+        try:
+            await send(writer, f"{winner}\n{clocks[1]}\n{clocks[2]}\n{cells}\n")
+            writer.close()
+        except OSError:
+            pass
+    return {'winner': winner, 'black': black, 'white': white, 't1': clocks[1], 't2': clocks[2],
+            'latencies': latencies}
+
+
+def latency_summary(latencies, percentiles=(50, 90, 99)):
+    '''Count, mean, percentiles and max of move latencies, in milliseconds'''
+    if not latencies:
+        return {'moves': 0}
+    milliseconds = np.array(latencies) * 1000
+    summary = {'moves': len(latencies), 'mean_ms': float(milliseconds.mean())}
+    for percentile in percentiles:
+        summary[f'p{percentile}_ms'] = float(np.percentile(milliseconds, percentile))
+    summary['max_ms'] = float(milliseconds.max())
+    return summary
+
+
+async def run_server(games, minutes=3, host='0.0.0.0', port_base=3333, pace=True):
+    '''Play "games" games at once and return their results and the latency summary'''
+    results = await asyncio.gather(*[play_game(host, port_base + 2 * game, minutes, pace) for game in range(games)],
+                                   return_exceptions=True)
+    finished = [result for result in results if not isinstance(result, Exception)]
+    errors = [repr(result) for result in results if isinstance(result, Exception)]
+    latencies = [latency for result in finished for latency in result['latencies']]
+    return {
+        'games': len(finished),
+        'errors': errors,
+        'wins': {str(player): sum(result['winner'] == player for result in finished) for player in (0, 1, 2)},
+        'latency': latency_summary(latencies),
+    }
+
+
+if __name__ == "__main__":
+    # python game_server.py <games> [minutes] [port base] [pace 1/0] [summary json file]
+    games = int(sys.argv[1])
+    minutes = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    port_base = int(sys.argv[3]) if len(sys.argv) > 3 else 3333
+    pace = sys.argv[4] != '0' if len(sys.argv) > 4 else True
+    summary = asyncio.run(run_server(games, minutes, port_base=port_base, pace=pace))
+    print(json.dumps(summary, indent=2))
+    if len(sys.argv) > 5:
+        with open(sys.argv[5], 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,81 @@
+from bitboard import SQUARE_VALUES2
+
+
+class MoveOrderer:
+    '''
+        Orders moves so alpha-beta finds cutoffs early. Moves are tried in
+        this order, each heuristic can be switched off:
+            1. the hash move (best move stored in the transposition table, or
+               at the root the best move of the previous iteration)
+            2. killer moves: the last moves that caused a cutoff at this ply
+            3. everything else by history score (how often and how deep the
+               move caused cutoffs), ties broken by the position_values2 table
+        It also counts how often a cutoff came from the first move tried,
+        which is the usual measure of how good the ordering is.
+    '''
+    def __init__(self, use_hash_move=True, use_killers=True, use_history=True, use_static=True, killer_slots=2):
+        self.use_hash_move = use_hash_move
+        self.use_killers = use_killers
+        self.use_history = use_history
+        self.use_static = use_static
+        self.killer_slots = killer_slots
+        self.killers = []
+        self.history = [[0] * 64 for _ in range(3)]
+        self.previous_best = None
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        '''Forget killers and age the history table before a new root search'''
+        self.killers = []
+        for table in self.history:
+            for square in range(64):
+                table[square] >>= 1
+
+    def order(self, moves, ply, turn, hash_move=None):
+        if len(moves) < 2:
+            return moves
+        if hash_move is None and ply == 0:
+            hash_move = self.previous_best
+
+        history = self.history[turn]
+        killers = self.killers[ply] if self.use_killers and ply < len(self.killers) else ()
+
+        def priority(move):
+            square = move[0] * 8 + move[1]
+            if self.use_hash_move and move == hash_move:
+                return (3, 0, 0)
+            if move in killers:
+                return (2, -killers.index(move), 0)
+            return (1,
+                    history[square] if self.use_history else 0,
+                    SQUARE_VALUES2[square] if self.use_static else 0)
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def record_cutoff(self, move, ply, turn, depth, move_index):
+        '''Call when "move" caused a beta cutoff after "move_index" other moves'''
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+
+        if self.use_killers:
+            while len(self.killers) <= ply:
+                self.killers.append([])
+            killers = self.killers[ply]
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[self.killer_slots:]
+
+        if self.use_history:
+            self.history[turn][move[0] * 8 + move[1]] += depth * depth
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def report(self):
+        return {
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoff_rate(),
+        }
@@ -0,0 +1,206 @@
+import sys
+import time
+import numpy as np
+from bitboard import BitboardGameState, board_to_bits
+from reversi_bot import ReversiBot
+
+# Opening book. Positions are stored from the point of view of the player to
+# move (own stones, opponent stones), folded over the 8 symmetries of the
+# board: of the 8 images of a position only the smallest (own, opp) pair is
+# kept, along with the best move in that image. The file is laid out in
+# columns so the sorted "own" column can be binary searched straight from
+# a memory map:
+#     16 byte header: magic, version, 3 padding bytes, entry count (uint64)
+#     own stones    n x uint64, sorted by (own, opp)
+#     opp stones    n x uint64
+#     scores        n x float32, search score of the move
+#     moves         n x uint8, square of the best move
+#     depths        n x uint8, depth it was searched to
+
+FILE_MAGIC = b'RVOB'
+FILE_VERSION = 1
+HEADER_BYTES = 16
+
+# Bits reversed within a byte, for mirroring each row
+REVERSED_BYTES = bytes(int(f"{value:08b}"[::-1], 2) for value in range(256))
+
+
+def flip_vertical(bits):
+    '''Swap row r with row 7 - r'''
+    return int.from_bytes(bits.to_bytes(8, 'little'), 'big')
+
+
+def mirror_horizontal(bits):
+    '''Swap column c with column 7 - c'''
+    return int.from_bytes(bits.to_bytes(8, 'little').translate(REVERSED_BYTES), 'little')
+
+
+def transpose(bits):
+    '''Swap (row, col) with (col, row)'''
+    t = 0x0F0F0F0F00000000 & (bits ^ (bits << 28))
+    bits ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (bits ^ (bits << 14))
+    bits ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (bits ^ (bits << 7))
+    bits ^= t ^ (t >> 7)
+    return bits
+
+
+def build_symmetries():
+    '''The 8 symmetries of the board as functions on bit masks'''
+    flips = [
+        lambda bits: bits,
+        flip_vertical,
+        mirror_horizontal,
+        lambda bits: flip_vertical(mirror_horizontal(bits)),
+    ]
+    return flips + [lambda bits, flip=flip: transpose(flip(bits)) for flip in flips]
+
+
+SYMMETRIES = build_symmetries()
+
+
+def build_inverses():
+    '''Index of the symmetry that undoes each symmetry'''
+    # Any position with no symmetry of its own will do
+    sample = 0x0000000000010207
+    inverses = []
+    for forward in SYMMETRIES:
+        image = forward(sample)
+        inverses.append(next(i for i, backward in enumerate(SYMMETRIES) if backward(image) == sample))
+    return inverses
+
+
+INVERSES = build_inverses()
+
+
+def canonical(own, opp):
+    '''((own, opp) of the smallest image, index of the symmetry that produces it)'''
+    return min(((symmetry(own), symmetry(opp)), index) for index, symmetry in enumerate(SYMMETRIES))
+
+
+class OpeningBook:
+    '''
+        Read-only view of a book file. Nothing is parsed when the book is
+        opened: the columns are views of a memory map, and a lookup binary
+        searches the "own" column and then the entries sharing that "own"
+        value, so it touches O(log n) pages of the file.
+    '''
+    def __init__(self, path):
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        header = bytes(self.data[:HEADER_BYTES])
+        if header[:4] != FILE_MAGIC or header[4] != FILE_VERSION:
+            raise ValueError(f"{path} is not an opening book file")
+        count = int.from_bytes(header[8:16], 'little')
+        start = HEADER_BYTES
+        self.own = self.data[start:start + 8 * count].view('<u8')
+        start += 8 * count
+        self.opp = self.data[start:start + 8 * count].view('<u8')
+        start += 8 * count
+        self.scores = self.data[start:start + 4 * count].view('<f4')
+        start += 4 * count
+        self.moves = self.data[start:start + count]
+        start += count
+        self.depths = self.data[start:start + count]
+
+    def __len__(self):
+        return len(self.own)
+
+    def find(self, own, opp):
+        '''Index of the entry for an already folded (own, opp) pair, or None'''
+        own = np.uint64(own)
+        low = int(np.searchsorted(self.own, own, 'left'))
+        high = int(np.searchsorted(self.own, own, 'right'))
+        if low == high:
+            return None
+        index = low + int(np.searchsorted(self.opp[low:high], np.uint64(opp)))
+        if index < high and self.opp[index] == opp:
+            return index
+        return None
+
+    def lookup(self, own, opp):
+        '''Book move (row, col) for the player owning "own" to play, or None'''
+        key, symmetry = canonical(own, opp)
+        index = self.find(*key)
+        if index is None:
+            return None
+        # The stored move is in the folded image, map it back to this board
+        move_bit = SYMMETRIES[INVERSES[symmetry]](1 << int(self.moves[index]))
+        square = move_bit.bit_length() - 1
+        return (square >> 3, square & 7)
+
+    def lookup_state(self, state):
+        '''Book move for the player to move in a ReversiGameState, or None'''
+        return self.lookup(board_to_bits(state.board, state.turn), board_to_bits(state.board, 3 - state.turn))
+
+
+def save_book(path, entries):
+    '''
+        Write a book file. entries maps folded (own, opp) pairs to
+        (square of the best move in that image, score, depth).
+    '''
+    keys = sorted(entries)
+    values = [entries[key] for key in keys]
+    header = FILE_MAGIC + bytes([FILE_VERSION, 0, 0, 0]) + len(keys).to_bytes(8, 'little')
+    with open(path, 'wb') as f:
+        f.write(header)
+        np.array([own for own, _ in keys], dtype='<u8').tofile(f)
+        np.array([opp for _, opp in keys], dtype='<u8').tofile(f)
+        np.array([score for _, score, _ in values], dtype='<f4').tofile(f)
+        np.array([square for square, _, _ in values], dtype=np.uint8).tofile(f)
+        np.array([depth for _, _, depth in values], dtype=np.uint8).tofile(f)
+
+
+def build_book(plies, depth, bot):
+    '''
+        Search every position of the first "plies" plies (all moves for both
+        sides, each symmetric family once) to "depth" with bot, and return
+        the entries for save_book
+    '''
+    entries = {}
+    state = BitboardGameState([0, 0, 0], 1, bot.w_1, bot.w_2, bot.w_3, bot.w_4, bot.w_5, bot.w_6, bot.w_7)
+    level = [state]
+    for ply in range(plies):
+        started = time.perf_counter()
+        next_level = {}
+        for state in level:
+            moves = state.get_valid_moves()
+            if not moves:
+                continue
+            own = state.pieces[state.turn]
+            opp = state.pieces[3 - state.turn]
+            key, symmetry = canonical(own, opp)
+
+            if bot.table is not None:
+                bot.table.new_search()
+            bot.orderer.new_search()
+            bot.orderer.previous_best = None
+            searcher = bot.search(state, depth)
+            row, col = searcher.best_move()
+            entries[key] = (SYMMETRIES[symmetry](1 << (row * 8 + col)).bit_length() - 1,
+                            searcher.root_scores[(row, col)], depth)
+
+            for move in moves:
+                child = state.clone_state()
+                child.make_move(move)
+                child_key, _ = canonical(child.pieces[child.turn], child.pieces[3 - child.turn])
+                next_level.setdefault(child_key, child)
+        print(f"ply {ply}: {len(level)} positions in {time.perf_counter() - started:.1f}s")
+        level = list(next_level.values())
+    return entries
+
+
+if __name__ == "__main__":
+    # python opening_book.py <plies> <depth> <output file> [pattern table file]
+    plies = int(sys.argv[1])
+    depth = int(sys.argv[2])
+    path = sys.argv[3]
+    evaluator = None
+    if len(sys.argv) > 4:
+        from patterns import PatternEvaluator
+        evaluator = PatternEvaluator.load(sys.argv[4])
+    # Without pattern tables, the weights of the NEW_BILLY client scripts
+    bot = ReversiBot(1, depth, 0.234, 0.5999, 0, 0.405, 0.777, 0, 0, evaluator=evaluator, endgame_empties=0)
+    entries = build_book(plies, depth, bot)
+    save_book(path, entries)
+    print(f"{len(entries)} positions written to {path}")
@@ -0,0 +1,150 @@
+import multiprocessing as mp
+import random
+import sys
+import time
+from bitboard import BitboardGameState
+from move_ordering import MoveOrderer
+from patterns import PatternEvaluator
+from reversi import ReversiGameState
+from reversi_bot import MiniMax, ReversiBot
+from time_manager import SearchTimeout
+from transposition import SharedTranspositionTable
+
+# Lazy SMP. While the bot searches a position as usual, helper processes
+# search the same position too, all of them sharing one transposition table
+# in shared memory. The helpers' results are thrown away: what they add is
+# the table entries (scores, bounds and best moves) they leave behind for the
+# main search. Helpers are staggered so they don't all walk the same tree in
+# step: odd helpers start one ply deeper than the main search, and each has
+# its own killers and history.
+#
+# Deadlines are time.perf_counter() values, which come from a system-wide
+# clock on Linux and macOS so the processes can share them.
+
+# Per-process state of a helper, set up by init_helper
+_helper = {}
+
+
+def init_helper(table_name, table_bytes, stop, evaluator_weights, algorithm):
+    _helper['table'] = SharedTranspositionTable(table_bytes, table_name)
+    _helper['stop'] = stop
+    _helper['algorithm'] = algorithm
+    _helper['orderer'] = MoveOrderer()
+    _helper['evaluator'] = PatternEvaluator(evaluator_weights) if evaluator_weights is not None else None
+
+
+def helper_search(pieces, turn, weights, age, first_depth, last_depth, deadline):
+    '''
+        Search first_depth, first_depth + 1, ... up to last_depth until the
+        deadline passes or the main search sets the stop flag. Returns the
+        deepest depth finished and its best move.
+    '''
+    table = _helper['table']
+    orderer = _helper['orderer']
+    table.age = age
+    orderer.new_search()
+    orderer.previous_best = None
+    state = BitboardGameState(list(pieces), turn, *weights)
+    result = (0, None)
+    for depth in range(first_depth, last_depth + 1):
+        searcher = MiniMax(state.clone_state(), depth, table, deadline, orderer, _helper['evaluator'], _helper['stop'],
+                           algorithm=_helper['algorithm'])
+        try:
+            move = searcher.search()
+        except SearchTimeout:
+            break
+        orderer.previous_best = move
+        result = (depth, move)
+    return result
+
+
+class ParallelSearch:
+    '''
+        A pool of helper processes and the shared table they search with.
+        Give "table" to the main search, call start before it and finish
+        after it, and close when done with the pool.
+    '''
+    def __init__(self, helpers, table_bytes=16 * 1024 * 1024, evaluator=None, algorithm='alphabeta'):
+        self.helpers = helpers
+        self.table = SharedTranspositionTable(table_bytes)
+        self.stop = mp.RawValue('b', 0)
+        evaluator_weights = evaluator.weights if evaluator is not None else None
+        # The node search of the main MiniMax, 'alphabeta' or 'pvs', so the
+        # helpers fill the table with the same kind of bounds
+        self.pool = mp.Pool(helpers, init_helper,
+                            (self.table.name, table_bytes, self.stop, evaluator_weights, algorithm))
+        self.pending = []
+
+    def start(self, state, last_depth, deadline=None):
+        '''Start the helpers on a BitboardGameState, searching up to last_depth'''
+        self.stop.value = 0
+        empties = 64 - state.get_piece_count(1) - state.get_piece_count(2)
+        weights = state.weights
+        self.pending = []
+        for helper in range(self.helpers):
+            offset = helper % 2
+            args = (list(state.pieces), state.turn, weights, self.table.age,
+                    1 + offset, min(empties, last_depth + offset), deadline)
+            self.pending.append(self.pool.apply_async(helper_search, args))
+
+    def finish(self):
+        '''Stop the helpers and return their (depth, move) results'''
+        self.stop.value = 1
+        results = [pending.get() for pending in self.pending]
+        self.pending = []
+        return results
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.table.close()
+
+
+def random_positions(count, plies, rng):
+    '''Positions reached by "plies" random moves from the start, for benchmarking'''
+    positions = []
+    while len(positions) < count:
+        state = BitboardGameState([0, 0, 0], 1, 0, 0, 0, 0, 0, 0, 0)
+        for _ in range(plies):
+            moves = state.get_valid_moves()
+            if not moves:
+                break
+            state.make_move(rng.choice(moves))
+        else:
+            positions.append((state.board, state.turn))
+    return positions
+
+
+def speedup_curve(max_workers, depth, positions, weights, evaluator=None):
+    '''
+        Time fixed-depth searches of every position with 1..max_workers
+        processes, starting each position from an empty table. Returns
+        (workers, seconds, speedup over 1 worker) rows.
+    '''
+    rows = []
+    for workers in range(1, max_workers + 1):
+        bot = ReversiBot(1, depth, *weights, evaluator=evaluator, endgame_empties=0, workers=workers)
+        elapsed = 0.0
+        for board, turn in positions:
+            bot.table.clear()
+            state = ReversiGameState(board, turn, *weights)
+            started = time.perf_counter()
+            bot.make_move(state)
+            elapsed += time.perf_counter() - started
+        bot.close()
+        rows.append((workers, elapsed, rows[0][1] / elapsed if rows else 1.0))
+    return rows
+
+
+if __name__ == "__main__":
+    # python parallel_search.py <max workers> <depth> [positions] [pattern table file]
+    max_workers = int(sys.argv[1])
+    depth = int(sys.argv[2])
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    evaluator = PatternEvaluator.load(sys.argv[4]) if len(sys.argv) > 4 else None
+    positions = random_positions(count, 20, random.Random(470))
+    weights = (0.234, 0.5999, 0, 0.405, 0.777, 0, 0)
+    print(f"{mp.cpu_count()} cores, {count} positions, depth {depth}")
+    print("workers  seconds  speedup")
+    for workers, seconds, speedup in speedup_curve(max_workers, depth, positions, weights, evaluator):
+        print(f"{workers:7d}  {seconds:7.2f}  {speedup:7.2f}")
@@ -0,0 +1,271 @@
+import random
+import sys
+import numpy as np
+from bitboard import BitboardGameState, POSITION_VALUES2
+
+# Pattern evaluator. The board is cut into the usual Othello patterns, each
+# pattern's squares are read as a base-3 number (0 empty, 1 ours, 2 theirs)
+# and that number indexes a table of learned weights. A position's score is
+# the sum of one table lookup per pattern instance, in discs from the point
+# of view of the player being evaluated. Symmetric instances of a pattern
+# (the same shape in another corner or edge) share one table.
+
+# Base shapes as (row, col) squares near the top left corner
+PATTERN_SHAPES = {
+    'edge_2x': [(0, c) for c in range(8)] + [(1, 1), (1, 6)],
+    'corner_2x5': [(r, c) for r in range(2) for c in range(5)],
+    'corner_3x3': [(r, c) for r in range(3) for c in range(3)],
+    'diagonal_8': [(i, i) for i in range(8)],
+    'diagonal_7': [(i, i + 1) for i in range(7)],
+    'diagonal_6': [(i, i + 2) for i in range(6)],
+    'diagonal_5': [(i, i + 3) for i in range(5)],
+    'diagonal_4': [(i, i + 4) for i in range(4)],
+}
+PATTERN_NAMES = list(PATTERN_SHAPES)
+MAX_PATTERN_SIZE = max(len(shape) for shape in PATTERN_SHAPES.values())
+
+# Board cell 64 is always empty; shorter patterns are padded with it
+EMPTY_CELL = 64
+
+FILE_MAGIC = b'RVPT'
+FILE_VERSION = 1
+
+
+def symmetries(row, col):
+    '''The 8 images of a square under rotation and reflection of the board'''
+    images = []
+    for transpose in (False, True):
+        r, c = (col, row) if transpose else (row, col)
+        for _ in range(4):
+            images.append((r, c))
+            r, c = c, 7 - r
+    return images
+
+
+def build_instances():
+    '''
+        Expand every shape by the board symmetries, dropping images that
+        cover the same squares as one already kept. Returns the (I, 10)
+        square array, the pattern index of each instance, and table sizes.
+    '''
+    squares = []
+    pattern_of = []
+    for pattern, shape in enumerate(PATTERN_SHAPES.values()):
+        seen = set()
+        for symmetry in range(8):
+            instance = [symmetries(r, c)[symmetry] for r, c in shape]
+            key = frozenset(instance)
+            if key in seen:
+                continue
+            seen.add(key)
+            cells = [r * 8 + c for r, c in instance]
+            squares.append(cells + [EMPTY_CELL] * (MAX_PATTERN_SIZE - len(cells)))
+            pattern_of.append(pattern)
+    sizes = [3 ** len(shape) for shape in PATTERN_SHAPES.values()]
+    return np.array(squares, dtype=np.intp), np.array(pattern_of, dtype=np.intp), sizes
+
+
+INSTANCE_SQUARES, INSTANCE_PATTERN, TABLE_SIZES = build_instances()
+TABLE_OFFSETS = np.concatenate([[0], np.cumsum(TABLE_SIZES)[:-1]]).astype(np.intp)
+TABLE_LENGTH = int(sum(TABLE_SIZES))
+POWERS = 3 ** np.arange(MAX_PATTERN_SIZE, dtype=np.intp)
+INSTANCE_OFFSETS = TABLE_OFFSETS[INSTANCE_PATTERN]
+
+
+def build_square_updates():
+    '''For each square, the (instance, power of 3) pairs of the patterns covering it'''
+    updates = [[] for _ in range(64)]
+    for instance, squares in enumerate(INSTANCE_SQUARES):
+        for digit, square in enumerate(squares):
+            if square != EMPTY_CELL:
+                updates[square].append((instance, 3 ** digit))
+    return [tuple(pairs) for pairs in updates]
+
+
+def build_swapped_indices():
+    '''Flat table index with the 1 and 2 digits exchanged, for each flat index'''
+    swapped = np.zeros(TABLE_LENGTH, dtype=np.intp)
+    for pattern, shape in enumerate(PATTERN_SHAPES.values()):
+        index = np.arange(3 ** len(shape))
+        digits = (index[:, None] // POWERS[:len(shape)]) % 3
+        digits = np.where(digits == 0, 0, 3 - digits)
+        swapped[TABLE_OFFSETS[pattern] + index] = TABLE_OFFSETS[pattern] + digits @ POWERS[:len(shape)]
+    return swapped
+
+
+SQUARE_UPDATES = build_square_updates()
+SWAPPED_INDICES = build_swapped_indices()
+
+
+def bits_to_cells(own, opp):
+    '''65 cells for the board: 1 for "own" stones, 2 for "opp" stones, else 0'''
+    own_cells = np.unpackbits(np.frombuffer(own.to_bytes(8, 'little'), dtype=np.uint8), bitorder='little')
+    opp_cells = np.unpackbits(np.frombuffer(opp.to_bytes(8, 'little'), dtype=np.uint8), bitorder='little')
+    cells = np.zeros(65, dtype=np.intp)
+    cells[:64] = own_cells + 2 * opp_cells
+    return cells
+
+
+def boards_to_cells(boards, players):
+    '''(N, 65) cells for (N, 8, 8) boards from the point of view of "players"'''
+    boards = np.asarray(boards).reshape(len(boards), 64)
+    players = np.broadcast_to(np.asarray(players), (len(boards),))[:, None]
+    cells = np.zeros((len(boards), 65), dtype=np.intp)
+    cells[:, :64] = np.where(boards == players, 1, np.where(boards == 3 - players, 2, 0))
+    return cells
+
+
+def stage_of(disc_counts, stages):
+    '''Game stage 0..stages-1 from the number of discs on the board'''
+    return np.minimum(stages - 1, (np.asarray(disc_counts) - 4) * stages // 61)
+
+
+class PatternEvaluator:
+    '''
+        Scores positions with pattern weight tables. weights has shape
+        (stages, TABLE_LENGTH): one set of tables per game stage, chosen by
+        the number of discs on the board.
+
+        In search the state keeps the index of every pattern instance up to
+        date as moves are made (see attach), with player 1's stones as digit
+        1 and player 2's as digit 2. Scoring a leaf is then one lookup per
+        instance, in tables whose digits are swapped for player 2.
+    '''
+    def __init__(self, weights):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.stages = self.weights.shape[0]
+        self.stage_of_discs = [int(stage_of(discs, self.stages)) for discs in range(65)]
+        self.player_tables = [None,
+                              [memoryview(np.ascontiguousarray(stage)) for stage in self.weights],
+                              [memoryview(np.ascontiguousarray(stage[SWAPPED_INDICES])) for stage in self.weights]]
+
+    @classmethod
+    def from_positional_table(cls, stages=1):
+        '''
+            Starting tables that reproduce the position_values2 sum, for use
+            before any tables have been trained. Each square's value is split
+            over the instances that cover it.
+        '''
+        square_values = np.array(POSITION_VALUES2, dtype=np.float32).ravel() / 10
+        coverage = np.bincount(INSTANCE_SQUARES.ravel(), minlength=65)[:64]
+        weights = np.zeros(TABLE_LENGTH, dtype=np.float32)
+        for pattern, shape in enumerate(PATTERN_SHAPES.values()):
+            instance = int(np.flatnonzero(INSTANCE_PATTERN == pattern)[0])
+            squares = INSTANCE_SQUARES[instance, :len(shape)]
+            digits = (np.arange(3 ** len(shape))[:, None] // POWERS[:len(shape)]) % 3
+            share = square_values[squares] / coverage[squares]
+            weights[TABLE_OFFSETS[pattern]:TABLE_OFFSETS[pattern] + 3 ** len(shape)] = \
+                ((digits == 1) * share).sum(axis=1) - ((digits == 2) * share).sum(axis=1)
+        return cls(np.tile(weights, (stages, 1)))
+
+    @classmethod
+    def load(cls, path):
+        '''Read tables written by save'''
+        with open(path, 'rb') as f:
+            header = f.read(8)
+            if header[:4] != FILE_MAGIC or header[4] != FILE_VERSION:
+                raise ValueError(f"{path} is not a pattern table file")
+            stages = header[5]
+            weights = np.fromfile(f, dtype='<f2', count=stages * TABLE_LENGTH)
+        return cls(weights.astype(np.float32).reshape(stages, TABLE_LENGTH))
+
+    def save(self, path):
+        '''
+            Write the tables as an 8 byte header (magic, version, stage
+            count) followed by little-endian float16 weights
+        '''
+        header = FILE_MAGIC + bytes([FILE_VERSION, self.stages, 0, 0])
+        with open(path, 'wb') as f:
+            f.write(header)
+            self.weights.astype('<f2').tofile(f)
+
+    def indices(self, cells, stages):
+        '''Flat weight index of every pattern instance for (N, 65) cells'''
+        return stages[:, None] * TABLE_LENGTH + cells[:, INSTANCE_SQUARES] @ POWERS + INSTANCE_OFFSETS
+
+    def attach(self, state):
+        '''Start keeping pattern indices on a BitboardGameState'''
+        cells = bits_to_cells(state.pieces[1], state.pieces[2])
+        state.pattern_indices = [int(index) for index in cells[INSTANCE_SQUARES] @ POWERS + INSTANCE_OFFSETS]
+        state.pattern_updates = SQUARE_UPDATES
+
+    def evaluate(self, state, player):
+        '''Score a BitboardGameState for player, in discs'''
+        if state.pattern_indices is None:
+            self.attach(state)
+        table = self.player_tables[player][self.stage_of_discs[state.counts[1] + state.counts[2]]]
+        return sum(map(table.__getitem__, state.pattern_indices))
+
+    def evaluate_boards(self, boards, players):
+        '''Score (N, 8, 8) boards at once, each for its entry in players'''
+        cells = boards_to_cells(boards, players)
+        stages = stage_of((cells[:, :64] != 0).sum(axis=1), self.stages)
+        return self.weights.ravel()[self.indices(cells, stages)].sum(axis=1)
+
+    def fit(self, boards, players, targets, epochs=20, learning_rate=0.5):
+        '''
+            Fit the tables to (N, 8, 8) boards labelled with final disc
+            differentials for "players". Each epoch moves every weight by the
+            mean error of the positions that used it.
+        '''
+        cells = boards_to_cells(boards, players)
+        stages = stage_of((cells[:, :64] != 0).sum(axis=1), self.stages)
+        index = self.indices(cells, stages)
+        targets = np.asarray(targets, dtype=np.float32)
+        flat = self.weights.ravel()
+        counts = np.bincount(index.ravel(), minlength=flat.size).astype(np.float32)
+        seen = counts > 0
+        for epoch in range(epochs):
+            errors = targets - flat[index].sum(axis=1)
+            total = np.bincount(index.ravel(), weights=np.repeat(errors, index.shape[1]), minlength=flat.size)
+            flat[seen] += learning_rate * total[seen] / counts[seen] / index.shape[1]
+            print(f"epoch {epoch + 1}: mean abs error {np.abs(errors).mean():.3f}")
+        self.weights = flat.reshape(self.weights.shape)
+
+
+def self_play_positions(games, rng, greedy=0.5):
+    '''
+        Play games where each move is either the move with the best
+        position_values2 square (with probability "greedy") or a random one,
+        and return every position with the final disc differential for the
+        player to move.
+    '''
+    square_values = [v for row in POSITION_VALUES2 for v in row]
+    boards = []
+    players = []
+    targets = []
+    for _ in range(games):
+        state = BitboardGameState([0, 0, 0], 1, 0, 0, 0, 0, 0, 0, 0)
+        positions = []
+        passes = 0
+        while passes < 2:
+            moves = state.get_valid_moves()
+            if not moves:
+                passes += 1
+                state.make_move(None)
+                continue
+            passes = 0
+            if state.get_piece_count(1) + state.get_piece_count(2) >= 4:
+                positions.append((state.board, state.turn))
+            if rng.random() < greedy:
+                move = max(moves, key=lambda m: square_values[m[0] * 8 + m[1]] + rng.random())
+            else:
+                move = rng.choice(moves)
+            state.make_move(move)
+        differential = state.get_piece_count(1) - state.get_piece_count(2)
+        for board, turn in positions:
+            boards.append(board)
+            players.append(turn)
+            targets.append(differential if turn == 1 else -differential)
+    return np.array(boards), np.array(players), np.array(targets)
+
+
+if __name__ == "__main__":
+    # python patterns.py <games> <output file> [stages]
+    games = int(sys.argv[1])
+    path = sys.argv[2]
+    stages = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    boards, players, targets = self_play_positions(games, random.Random(470))
+    evaluator = PatternEvaluator.from_positional_table(stages)
+    evaluator.fit(boards, players, targets)
+    evaluator.save(path)
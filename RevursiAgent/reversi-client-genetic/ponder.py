@@ -0,0 +1,83 @@
+import threading
+from reversi_bot import MiniMax
+from time_manager import SearchTimeout
+
+
+class StopFlag:
+    '''Stop flag for MiniMax searches running in another thread'''
+    def __init__(self):
+        self.value = 0
+
+
+class Ponderer:
+    '''
+        Thinks on the opponent's time. start() takes the position after our
+        move and searches, in a background thread, the position after each
+        opponent reply: the reply the table predicts first, then the others,
+        all of them one depth at a time so the likely ones are never far
+        behind. The thread mostly runs while the main thread waits on the
+        socket, which releases the GIL.
+
+        The searches use the bot's transposition table and move orderer, so
+        stop() must be called before the bot searches again. The deepest
+        finished search of each position is kept in "results" by Zobrist
+        hash, for the bot to pick up once the real reply is known.
+    '''
+    def __init__(self, bot):
+        self.bot = bot
+        self.stop_flag = StopFlag()
+        self.thread = None
+        # position hash -> (depth, MiniMax of the deepest finished search)
+        self.results = {}
+
+    def start(self, state):
+        '''Ponder on a BitboardGameState with the opponent to move'''
+        self.stop()
+        self.results = {}
+        self.stop_flag.value = 0
+        self.thread = threading.Thread(target=self.run, args=(state,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_flag.value = 1
+            self.thread.join()
+            self.thread = None
+
+    def lookup(self, state):
+        '''(depth, MiniMax) pondered for state, or None'''
+        return self.results.get(state.hash)
+
+    def run(self, state):
+        bot = self.bot
+        replies = state.get_valid_moves() or [None]
+        # The move the table holds for this position is the reply our own
+        # search expected
+        entry = bot.table.probe(state.hash) if bot.table is not None else None
+        if entry is not None and entry[3] in replies:
+            replies.remove(entry[3])
+            replies.insert(0, entry[3])
+
+        positions = []
+        for reply in replies:
+            position = state.clone_state()
+            position.make_move(reply)
+            # Nothing to think about if we will have to pass
+            if position.get_valid_moves():
+                positions.append(position)
+        if not positions:
+            return
+        empties = 64 - state.get_piece_count(1) - state.get_piece_count(2)
+
+        bot.orderer.new_search()
+        try:
+            for depth in range(1, empties):
+                for position in positions:
+                    previous = self.results.get(position.hash)
+                    bot.orderer.previous_best = previous[1].best_move() if previous is not None else None
+                    searcher = MiniMax(position.clone_state(), depth, bot.table, None, bot.orderer,
+                                       bot.evaluator, self.stop_flag, algorithm=bot.node_algorithm)
+                    searcher.search()
+                    self.results[position.hash] = (depth, searcher)
+        except SearchTimeout:
+            pass
@@ -1,6 +1,7 @@
 import random
 import numpy as np
 import reversi_bot
+from bitboard import board_to_bits, stability, POSITION_VALUES
 import socket
 import sys
 import time
@@ -14,28 +15,42 @@ class ReversiServerConnection:
 
     def get_game_state(self):
         server_msg = self.sock.recv(1024).decode('utf-8').split('\n')
+        return parse_game_state(server_msg)
 
-        turn = int(server_msg[0])
+    def send_move(self, move):
+        self.sock.send(format_move(move).encode('utf-8'))
 
-        # If the game is over
-        if turn == -999:
-            return ReversiGameState(None, turn,0,0,0,0,0,0,0)
+def parse_game_state(server_msg):
+    '''
+    Build a ReversiGameState from the lines of a server message: the turn,
+    then (unless the turn is -999, game over) the round, both players'
+    remaining seconds and the 64 squares
+    '''
+    turn = int(server_msg[0])
 
-        # Flip is necessary because of the way the server does indexing
-        board = np.flip(np.array([int(x) for x in server_msg[4:68]]).reshape(8, 8), 0)
+    # If the game is over
+    if turn == -999:
+        return ReversiGameState(None, turn,0,0,0,0,0,0,0)
 
-        return ReversiGameState(board, turn,0,0,0,0,0,0,0)
+    # Lines 2-4 are the round and both players' remaining seconds
+    round = int(server_msg[1])
+    t1 = float(server_msg[2])
+    t2 = float(server_msg[3])
 
-    def send_move(self, move):
-        # The 7 - bit is necessary because of the way the server does indexing
-        move_str = str(7 - move[0]) + '\n' + str(move[1]) + '\n'
-        self.sock.send(move_str.encode('utf-8'))
+    # Flip is necessary because of the way the server does indexing
+    board = np.flip(np.array([int(x) for x in server_msg[4:68]]).reshape(8, 8), 0)
+
+    return ReversiGameState(board, turn,0,0,0,0,0,0,0, round=round, t1=t1, t2=t2)
+
+def format_move(move):
+    # The 7 - bit is necessary because of the way the server does indexing
+    return str(7 - move[0]) + '\n' + str(move[1]) + '\n'
 
 class ReversiGame:
-    def __init__(self, host, bot_move_num, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7):
+    def __init__(self, host, bot_move_num, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7, evaluator=None, book=None, workers=1, ponder=False):
         self.bot_move_num = bot_move_num
         self.server_conn = ReversiServerConnection(host, bot_move_num)
-        self.bot = reversi_bot.ReversiBot(bot_move_num, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7)
+        self.bot = reversi_bot.ReversiBot(bot_move_num, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7, evaluator=evaluator, book=book, workers=workers, ponder=ponder)
 
     def play(self):
         while True:
@@ -43,6 +58,7 @@ class ReversiGame:
 
             # If the game is over
             if state.turn == -999:
+                self.bot.close()
                 time.sleep(1)
                 sys.exit()
 
@@ -50,44 +66,62 @@ class ReversiGame:
             if state.turn == self.bot_move_num:
                 move = self.bot.make_move(state)
                 self.server_conn.send_move(move)
+                # Think about the reply while the opponent does
+                self.bot.ponder(state, move)
+
+# Shared by every ReversiGameState, so they are read-only
+POSITION_TABLE = np.array(POSITION_VALUES)
+POSITION_TABLE.flags.writeable = False
+DIRECTIONS = tuple((dx, dy) for dx in range(-1, 2) for dy in range(-1, 2) if not (dx == 0 and dy == 0))
+
+
+def weight_property(index):
+    return property(lambda self: self.weights[index])
+
 
 class ReversiGameState:
-    def __init__(self, board, turn, w_1, w_2, w_3, w_4, w_5, w_6, w_7):
-        self.board_dim = 8 # Reversi is played on an 8x8 board
+    '''
+        The weights live in one tuple ("weights") that clones share and the
+        bot hands out (see ReversiBot.set_weights); w_1 to w_7 read from it.
+        Everything else per state is in __slots__, and the constant tables
+        are module level, so a clone is little more than a copy of the board.
+    '''
+    __slots__ = ('board', 'turn', 'undo_stack', 'round', 't1', 't2', 'weights')
+    board_dim = 8 # Reversi is played on an 8x8 board
+
+    def __init__(self, board, turn, w_1, w_2, w_3, w_4, w_5, w_6, w_7, round=None, t1=None, t2=None):
         self.board = board
         self.turn = turn # Whose turn is it
-        self.simulated_moves = []
-        self.w_1 = w_1
-        self.w_2 = w_2
-        self.w_3 = w_3
-        self.w_4 = w_4
-        self.w_5 = w_5
-        self.w_6 = w_6
-        self.w_7 = w_7
-        self.position_values = np.array([
-            [1.00, 0.20, 0.70, 0.60, 0.60, 0.70, 0.20, 1.00],
-            [0.20, 0.10, 0.55, 0.50, 0.50, 0.55, 0.10, 0.20],
-            [0.70, 0.55, 0.60, 0.55, 0.55, 0.60, 0.55, 0.70],
-            [0.60, 0.50, 0.55, 0.50, 0.50, 0.55, 0.50, 0.60],
-            [0.60, 0.50, 0.55, 0.50, 0.50, 0.55, 0.50, 0.60],
-            [0.70, 0.55, 0.60, 0.55, 0.55, 0.60, 0.55, 0.70],
-            [0.20, 0.10, 0.55, 0.50, 0.50, 0.55, 0.10, 0.20],
-            [1.00, 0.20, 0.70, 0.60, 0.60, 0.70, 0.20, 1.00]
-        ])
-
-        self.position_values2 = np.array([
-            [100, -15, 55, 40, 40, 55, -15, 100],
-            [-15, -35, -20, 5, 5, -20, -35, -15],
-            [55, -20, 10, 10, 10, 10, -20, 55],
-            [40, 5, 10, -15, -15, 10, 5, 40],
-            [40, 5, 10, -15, -15, 10, 5, 40],
-            [55, -20, 10, 10, 10, 10, -20, 55],
-            [-15, -35, -20, 5, 5, -20, -35, -15],
-            [100, -15, 55, 40, 40, 55, -15, 100]
-        ])
+        self.undo_stack = [] # (move, flipped squares) for each make_move
+        self.round = round
+        # Seconds left on each player's clock, when the server told us
+        self.t1 = t1
+        self.t2 = t2
+        self.weights = (w_1, w_2, w_3, w_4, w_5, w_6, w_7)
+
+    w_1 = weight_property(0)
+    w_2 = weight_property(1)
+    w_3 = weight_property(2)
+    w_4 = weight_property(3)
+    w_5 = weight_property(4)
+    w_6 = weight_property(5)
+    w_7 = weight_property(6)
 
     def clone_state(self):
-        return ReversiGameState(self.board, self.turn, self.w_1, self.w_2, self.w_3, self.w_4, self.w_5, self.w_6, self.w_7)
+        # The board is copied because make_move changes it in place, as
+        # int8 since it only ever holds 0, 1 and 2
+        clone = ReversiGameState.__new__(ReversiGameState)
+        clone.board = self.board.astype(np.int8)
+        clone.turn = self.turn
+        clone.undo_stack = []
+        clone.round = self.round
+        clone.t1 = self.t1
+        clone.t2 = self.t2
+        clone.weights = self.weights
+        return clone
+
+    def time_remaining(self, player):
+        return self.t1 if player == 1 else self.t2
 
     def capture_will_occur(self, row, col, xdir, ydir, could_capture=0):
         # We shouldn't be able to leave the board
@@ -111,11 +145,10 @@ class ReversiGameState:
     def simulate_move(self, move):
         board_copy = np.copy(self.board)
         board_copy[move[0], move[1]] = self.turn
-        directions = [(dx, dy) for dx in range(-1, 2) for dy in range(-1, 2) if not (dx == 0 and dy == 0)]
-        
+
         row = move[0]
         col = move[1]
-        for dx, dy in directions:
+        for dx, dy in DIRECTIONS:
             curr_row = row + dy
             curr_col = col + dx
             
@@ -132,6 +165,35 @@ class ReversiGameState:
         self.board = board_copy
         return self.get_score(self.turn)
 
+    def make_move(self, move):
+        '''Play move (None to pass) in place and hand the turn to the opponent'''
+        flipped = []
+        if move is not None:
+            row, col = move
+            for dx in range(-1, 2):
+                for dy in range(-1, 2):
+                    if (dx != 0 or dy != 0) and self.capture_will_occur(row + dy, col + dx, dx, dy):
+                        curr_row = row + dy
+                        curr_col = col + dx
+                        while self.board[curr_row, curr_col] != self.turn:
+                            flipped.append((curr_row, curr_col))
+                            curr_row += dy
+                            curr_col += dx
+            self.board[row, col] = self.turn
+            for square in flipped:
+                self.board[square] = self.turn
+        self.undo_stack.append((move, flipped))
+        self.change_turn()
+
+    def unmake_move(self):
+        '''Take back the last make_move'''
+        move, flipped = self.undo_stack.pop()
+        self.change_turn()
+        if move is not None:
+            self.board[move] = 0
+            for square in flipped:
+                self.board[square] = 3 - self.turn
+
     def get_score(self, turn):
         return self.w_1 * self.coin_parity(turn) + \
                self.w_2 * self.mobility(turn) + \
@@ -152,7 +214,11 @@ class ReversiGameState:
     def mobility(self,player):
         if(self.w_2 < 0.2):
             return 0
-        return 100 * len(self.get_valid_moves()) / (self.board_dim * self.board_dim)
+        turn = self.turn
+        self.turn = player
+        move_count = len(self.get_valid_moves())
+        self.turn = turn
+        return 100 * move_count / (self.board_dim * self.board_dim)
 
     def corners_captured(self, player):
         if(self.w_3 < 0.2):
@@ -165,20 +231,8 @@ class ReversiGameState:
     def get_stability(self, player):
         if self.w_4 < 0.2:
             return 0
-            
-        user_stable = 0
-        for i in range(self.board_dim):
-            for j in range(self.board_dim):
-                if self.board[i, j] == player:
-                    user_stable += self.position_values2[i][j]
-
-        enemy_stable = 0
-        for i in range(self.board_dim):
-            for j in range(self.board_dim):
-                if self.board[i, j] == 3 - player:
-                    enemy_stable += self.position_values2[i][j]
-        
-        return (user_stable - enemy_stable) / 10
+        # Stable discs are found on bitboards, see bitboard.stable_discs
+        return stability(board_to_bits(self.board, player), board_to_bits(self.board, 3 - player))
         
         
         
@@ -187,12 +241,7 @@ class ReversiGameState:
         if(self.w_5 < 0.1):
             return 0
 
-        total = 0
-        for i in range(self.board_dim):
-            for j in range(self.board_dim):
-                if self.board[i, j] == turn:
-                    total += self.position_values[i][j]
-        return total / 100
+        return POSITION_TABLE[self.board == turn].sum() / 100
     
     def get_random_weight(self):
         if(self.w_6 < 0.1):
@@ -205,12 +254,10 @@ class ReversiGameState:
         if self.w_7 < 0.1:
             return 0
         frontier_count = 0
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
-        
         for row in range(self.board_dim):
             for col in range(self.board_dim):
                 if self.board[row, col] == player:
-                    for dx, dy in directions:
+                    for dx, dy in DIRECTIONS:
                         adj_row, adj_col = row + dy, col + dx
                         if self.space_is_on_board(adj_row, adj_col) and self.space_is_unoccupied(adj_row, adj_col):
                             frontier_count += 1
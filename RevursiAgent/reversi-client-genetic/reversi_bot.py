@@ -1,55 +1,355 @@
 import random as rand
+import time
+from bitboard import BitboardGameState
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+from time_manager import TimeManager, SearchTimeout
+from move_ordering import MoveOrderer
+from endgame import EndgameSolver
+from telemetry import TimedState
+
+# Width of the null windows PVS tests moves with. Scores are floats, so any
+# positive width works.
+NULL_WINDOW = 1e-6
+# Null window width used by MTD(f), which stops once the score is known to
+# within this much
+MTD_STEP = 0.5
+# A bound seen from the other side: a lower bound for one player is an
+# upper bound for the other
+OTHER_SIDE_BOUND = {EXACT: EXACT, LOWER_BOUND: UPPER_BOUND, UPPER_BOUND: LOWER_BOUND}
 
 class MiniMax:
-    def __init__(self, state, parent: 'MiniMax', move: tuple, max_depth: int, alpha, beta):
+    '''
+        Alpha-beta search on a single game state. Moves are played in place
+        with make_move and taken back with unmake_move, so no tree is built
+        and only the score of each root move is kept (root_scores). Scores
+        are from the point of view of the player to move at the root, who
+        maximizes while the opponent minimizes. Leaves are scored with
+        state.get_score, or with evaluator.evaluate(state, player) if an
+        evaluator such as PatternEvaluator is given; evaluator.attach(state)
+        is called first so it can keep its own data on the state.
+
+        If the deadline passes, or stop (any object with a "value", such as
+        a multiprocessing.Value) becomes nonzero, the search raises
+        SearchTimeout and leaves the state part way down a line, so search on
+        a copy you can throw away.
+
+        stats, a telemetry.SearchStats, collects leaves, cutoffs and
+        evaluation time. Wrap the state in a telemetry.TimedState as well
+        to time move generation and make/unmake.
+
+        algorithm picks the node search:
+            'alphabeta'  min/max alpha-beta (expand)
+            'pvs'        negamax principal variation search (negamax): the
+                         first move gets the full window and the rest a null
+                         window, re-searched only if they turn out better
+        Both store scores in the table from the root player's point of
+        view, so they can share one table.
+    '''
+    def __init__(self, state, max_depth: int, table: TranspositionTable = None, deadline: float = None,
+                 orderer: MoveOrderer = None, evaluator=None, stop=None, stats=None, algorithm='alphabeta'):
         self.state = state
-        self.parent = parent
-        self.move = move
-        self.alpha = alpha
-        self.beta = beta
-        self.children = []
         self.max_depth = max_depth
-        self.cost = 0
+        self.evaluator = evaluator
+        if evaluator is not None:
+            evaluator.attach(state)
+        self.table = table
+        self.deadline = deadline
+        self.stop = stop
+        self.stats = stats
+        self.orderer = orderer
+        self.player = state.turn
+        self.root_scores = {}
+        self.node_search = self.negamax if algorithm == 'pvs' else self.expand
+        # Score of the root from the last search
+        self.value = None
+        # Nodes expanded, for benchmarks
+        self.nodes = 0
 
-    def expand(self, maximizing_player):
+    def search(self, alpha=float("-inf"), beta=float("inf")):
         '''
-            Expand the node boiiiii
+            Score every root move and return the best one, or None without
+            moves. With a narrower window than the default the root value
+            is only a bound if it falls outside (alpha, beta).
         '''
-        if self.max_depth == 0:
-            return self.state.get_score(self.state.turn)
-        if maximizing_player:
-            value = float("-inf")
+        self.root_scores = {}
+        self.value = self.node_search(self.max_depth, alpha, beta, 0)
+        return self.best_move()
+
+    def mtdf(self, guess):
+        '''
+            MTD(f): find the root value with a series of null window
+            searches, starting at guess (usually the previous iteration's
+            value) and closing in on it from both sides. Returns the best
+            move. Every pass but the last is cut short by the table.
+        '''
+        lower = float("-inf")
+        upper = float("inf")
+        value = guess
+        best_scores = None
+        while lower < upper - MTD_STEP:
+            beta = max(value, lower + MTD_STEP)
+            self.search(beta - MTD_STEP, beta)
+            value = self.value
+            if value < beta:
+                upper = value
+            else:
+                lower = value
+                # The root move that failed high is the best found so far
+                best_scores = self.root_scores
+        if best_scores is not None:
+            self.root_scores = best_scores
+        return self.best_move()
+
+    def best_move(self):
+        best_move = None
+        for move, score in self.root_scores.items():
+            if best_move is None or score > self.root_scores[best_move]:
+                best_move = move
+        return best_move
+
+    def evaluate(self):
+        if self.stats is not None:
+            return self.timed_evaluate()
+        if self.evaluator is None:
+            return self.state.get_score(self.player)
+        return self.evaluator.evaluate(self.state, self.player)
+
+    def timed_evaluate(self):
+        stats = self.stats
+        stats.leaves += 1
+        started = time.perf_counter()
+        if self.evaluator is None:
+            value = self.state.get_score(self.player)
         else:
-            value = float("inf")
+            value = self.evaluator.evaluate(self.state, self.player)
+        stats.eval_seconds += time.perf_counter() - started
+        return value
+
+    def expand(self, depth, alpha, beta, ply):
+        '''
+            Expand the node boiiiii
+        '''
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.stop is not None and self.stop.value:
+            raise SearchTimeout()
+        self.nodes += 1
+        state = self.state
+        if depth == 0:
+            return self.evaluate()
+
+        key = None
+        hash_move = None
+        if self.table is not None:
+            key = state.hash
+            entry = self.table.probe(key)
+            if entry is not None:
+                hash_move = entry[3]
+            # The root always expands so every root move gets a score
+            if entry is not None and ply > 0 and entry[0] >= depth:
+                _, bound, score, _ = entry
+                if bound == EXACT or \
+                        (bound == LOWER_BOUND and score >= beta) or \
+                        (bound == UPPER_BOUND and score <= alpha):
+                    return score
 
-        valid_moves = self.state.get_valid_moves()
+        valid_moves = state.get_valid_moves()
         if not valid_moves:
-            return self.state.get_score(self.state.turn)
-    
-        for move in valid_moves:
-            new_state = self.state.clone_state()
-            new_state.simulate_move(move)
+            if ply == 0:
+                return self.evaluate()
+            # Pass if the opponent can move, otherwise the game is over
+            state.make_move(None)
+            if state.get_valid_moves():
+                value = self.expand(depth, alpha, beta, ply + 1)
+                state.unmake_move()
+                return value
+            state.unmake_move()
+            return self.evaluate()
+        if self.orderer is not None:
+            valid_moves = self.orderer.order(valid_moves, ply, state.turn, hash_move)
 
-            child_node = MiniMax(new_state, self, move, self.max_depth - 1, self.alpha, self.beta)
-            self.children.append(child_node)
+        maximizing_player = state.turn == self.player
+        value = float("-inf") if maximizing_player else float("inf")
+        original_alpha = alpha
+        original_beta = beta
+        best_move = None
+        for index, move in enumerate(valid_moves):
+            state.make_move(move)
+            child_value = self.expand(depth - 1, alpha, beta, ply + 1)
+            state.unmake_move()
+            if ply == 0:
+                self.root_scores[move] = child_value
 
             if maximizing_player:
-                value = max(value, child_node.expand(False))
-                self.alpha = max(self.alpha, value)
-                if value >= self.beta:
-                    break
+                if child_value > value:
+                    value = child_value
+                    best_move = move
+                alpha = max(alpha, value)
             else:
-                value = min(value, child_node.expand(True))
-                self.beta = min(self.beta, value)
-                if value <= self.alpha:
-                    break
-        self.cost = value
+                if child_value < value:
+                    value = child_value
+                    best_move = move
+                beta = min(beta, value)
+            if alpha >= beta:
+                if self.stats is not None:
+                    self.stats.cutoff(ply)
+                if self.orderer is not None:
+                    self.orderer.record_cutoff(move, ply, state.turn, depth, index)
+                break
+
+        if key is not None:
+            if value <= original_alpha:
+                bound = UPPER_BOUND
+            elif value >= original_beta:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            self.table.store(key, depth, bound, value, best_move)
+        return value
+
+    def negamax(self, depth, alpha, beta, ply):
+        '''
+            Principal variation search. Scores, alpha and beta are from the
+            point of view of the player to move at this node.
+        '''
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if self.stop is not None and self.stop.value:
+            raise SearchTimeout()
+        self.nodes += 1
+        state = self.state
+        sign = 1 if state.turn == self.player else -1
+        if depth == 0:
+            return sign * self.evaluate()
+
+        key = None
+        hash_move = None
+        if self.table is not None:
+            key = state.hash
+            entry = self.table.probe(key)
+            if entry is not None:
+                hash_move = entry[3]
+            if entry is not None and ply > 0 and entry[0] >= depth:
+                _, bound, score, _ = entry
+                if sign < 0:
+                    bound = OTHER_SIDE_BOUND[bound]
+                    score = -score
+                if bound == EXACT or \
+                        (bound == LOWER_BOUND and score >= beta) or \
+                        (bound == UPPER_BOUND and score <= alpha):
+                    return score
+
+        valid_moves = state.get_valid_moves()
+        if not valid_moves:
+            if ply == 0:
+                return sign * self.evaluate()
+            state.make_move(None)
+            if state.get_valid_moves():
+                value = -self.negamax(depth, -beta, -alpha, ply + 1)
+                state.unmake_move()
+                return value
+            state.unmake_move()
+            return sign * self.evaluate()
+        if self.orderer is not None:
+            valid_moves = self.orderer.order(valid_moves, ply, state.turn, hash_move)
+
+        value = float("-inf")
+        original_alpha = alpha
+        best_move = None
+        for index, move in enumerate(valid_moves):
+            state.make_move(move)
+            if index == 0:
+                child_value = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                child_value = -self.negamax(depth - 1, -alpha - NULL_WINDOW, -alpha, ply + 1)
+                if alpha < child_value < beta:
+                    child_value = -self.negamax(depth - 1, -beta, -child_value, ply + 1)
+            state.unmake_move()
+            if ply == 0:
+                self.root_scores[move] = child_value
+
+            if child_value > value:
+                value = child_value
+                best_move = move
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                if self.stats is not None:
+                    self.stats.cutoff(ply)
+                if self.orderer is not None:
+                    self.orderer.record_cutoff(move, ply, state.turn, depth, index)
+                break
+
+        if key is not None:
+            if value <= original_alpha:
+                bound = UPPER_BOUND
+            elif value >= beta:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            if sign < 0:
+                self.table.store(key, depth, OTHER_SIDE_BOUND[bound], -value, best_move)
+            else:
+                self.table.store(key, depth, bound, value, best_move)
         return value
 
 class ReversiBot:
-    def __init__(self, move_num, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7):
+    def __init__(self, move_num, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7, backend='bitboard',
+                 table_bytes=16 * 1024 * 1024, time_manager=None, orderer=None, evaluator=None,
+                 endgame_empties=12, book=None, workers=1, ponder=False, telemetry=None,
+                 algorithm='alphabeta', aspiration_window=0, reuse=True, endgame_seconds=5.0):
         self.move_num = move_num
+        # Fixed search depth, used when the state carries no clock
         self.max_depth = max_depth
+        # With a clock we deepen iteratively until the TimeManager's budget runs out
+        self.time_manager = time_manager if time_manager is not None else TimeManager()
+        # Pass MoveOrderer(use_...=False) to switch heuristics off
+        self.orderer = orderer if orderer is not None else MoveOrderer()
+        # 'alphabeta', 'pvs' or 'mtdf' (see MiniMax). MTD(f) runs on the PVS
+        # node search, which is all null windows there anyway.
+        self.algorithm = algorithm
+        self.node_algorithm = 'alphabeta' if algorithm == 'alphabeta' else 'pvs'
+        # Above 0, each iteration of iterative deepening first searches a
+        # window this wide on either side of the last iteration's score
+        self.aspiration_window = aspiration_window
+        # Pick up iterative deepening at the depth the table already holds
+        # for the position, left there by the search of our last move
+        self.reuse = reuse
+        # 'bitboard' searches on BitboardGameState, 'numpy' on the state as given
+        self.backend = backend
+        # None scores leaves with the weighted features below; a
+        # PatternEvaluator (bitboard backend only) replaces them
+        self.evaluator = evaluator
+        # The transposition table needs the Zobrist hash only the bitboard
+        # state keeps, and is kept between moves. table_bytes=0 turns it off.
+        self.table = None
+        # workers > 1 adds workers - 1 helper processes searching the same
+        # position with a shared table (see parallel_search.py)
+        self.parallel = None
+        if backend == 'bitboard' and table_bytes and workers > 1:
+            from parallel_search import ParallelSearch
+            self.parallel = ParallelSearch(workers - 1, table_bytes, evaluator, self.node_algorithm)
+            self.table = self.parallel.table
+        elif backend == 'bitboard' and table_bytes:
+            self.table = TranspositionTable(table_bytes)
+        # ponder=True searches the opponent's replies while waiting for
+        # their move (see ponder.py), bitboard backend only
+        self.ponderer = None
+        if backend == 'bitboard' and ponder:
+            from ponder import Ponderer
+            self.ponderer = Ponderer(self)
+        # With this many empty squares or fewer the game is solved exactly
+        # instead of searched with the heuristic score. 0 turns it off.
+        self.endgame = EndgameSolver(endgame_empties) if endgame_empties else None
+        # Longest the solver may take when the state has no clock (the
+        # trainer's games) before the bot falls back to a fixed-depth
+        # search. None lets it run to the end.
+        self.endgame_seconds = endgame_seconds
+        # An OpeningBook: positions found in it are played without searching
+        self.book = book
+        # A telemetry.Telemetry gets a record of every move (see telemetry.py)
+        self.telemetry = telemetry
+        self.record = None
         self.w_1 = float(w_1) 
         self.w_2 = float(w_2)
         self.w_3 = float(w_3)
@@ -57,7 +357,167 @@ class ReversiBot:
         self.w_5 = float(w_5)
         self.w_6 = float(w_6)
         self.w_7 = float(w_7)
-    def make_move(self, state):
+        # Handed to every state the bot searches instead of copied onto it
+        self.weights = (self.w_1, self.w_2, self.w_3, self.w_4, self.w_5, self.w_6, self.w_7)
+
+    def search(self, state, depth, deadline=None, previous=None):
+        '''
+            Run one search of the given depth on a copy of state. previous
+            is the MiniMax of the last iteration, whose score is the guess
+            for MTD(f) and the centre of the aspiration window.
+        '''
+        if self.record is not None:
+            return self.recorded_search(state, depth, deadline, previous)
+        searcher = MiniMax(state.clone_state(), depth, self.table, deadline, self.orderer, self.evaluator,
+                           algorithm=self.node_algorithm)
+        best_move = self.run_search(searcher, previous)
+        if best_move is not None:
+            self.orderer.previous_best = best_move
+        return searcher
+
+    def reused_depth(self, state):
+        '''Depth of the table's entry for state, or 0 if there is none or reuse is off'''
+        if not self.reuse or self.table is None:
+            return 0
+        entry = self.table.probe(state.hash)
+        return entry[0] if entry is not None else 0
+
+    def run_search(self, searcher, previous=None):
+        guess = previous.value if previous is not None else None
+        if self.algorithm == 'mtdf':
+            return searcher.mtdf(guess if guess is not None else 0.0)
+        if self.aspiration_window and guess is not None:
+            alpha = guess - self.aspiration_window
+            beta = guess + self.aspiration_window
+            best_move = searcher.search(alpha, beta)
+            if alpha < searcher.value < beta:
+                return best_move
+            # The score fell outside the window, so it is only a bound
+        return searcher.search()
+
+    def recorded_search(self, state, depth, deadline=None, previous=None):
+        '''search, with its statistics added to the record of this move'''
+        stats = self.record.new_search(depth)
+        searcher = MiniMax(TimedState(state.clone_state(), stats), depth, self.table, deadline, self.orderer,
+                           self.evaluator, stats=stats, algorithm=self.node_algorithm)
+        started = time.perf_counter()
+        try:
+            best_move = self.run_search(searcher, previous)
+            stats.finished = True
+        finally:
+            stats.nodes = searcher.nodes
+            stats.seconds = time.perf_counter() - started
+        if best_move is not None:
+            self.orderer.previous_best = best_move
+        return searcher
+
+    def iterative_deepening(self, state, deadline, start=None):
+        '''
+            Search depth 1, 2, 3, ... until the deadline and return the
+            MiniMax of the deepest search that finished. An unfinished search is thrown
+            away, and an iteration is not started if the last one suggests it
+            can't finish in time. start=(depth, MiniMax) continues from a
+            search already done, such as a pondered one.
+        '''
+        empties = 64 - state.get_piece_count(1) - state.get_piece_count(2)
+        # Set while trying the depth the table already holds (see below)
+        skipped = False
+        if start is not None:
+            first_depth, searcher = start
+            self.orderer.previous_best = searcher.best_move()
+        else:
+            # The table entries below the reply we predicted last move (or
+            # any other reply it searched) let the search skip straight to
+            # the depth they were searched to, which costs little more
+            # than reading them back. Read before the depth 1 search, whose
+            # root entry replaces the deeper one.
+            reused = self.reused_depth(state)
+            # Depth 1 always runs so there is a move to return
+            first_depth = 1
+            searcher = self.search(state, 1)
+            if reused > 2:
+                first_depth = min(reused, empties) - 1
+                skipped = True
+        depth = first_depth + 1
+        while depth <= empties:
+            started = time.perf_counter()
+            # The skip gets half of the time left. If the table entries were
+            # overwritten it costs a full search, and the rest of the time
+            # goes to deepening from depth 2 as usual.
+            search_deadline = started + (deadline - started) / 2 if skipped else deadline
+            try:
+                searcher = self.search(state, depth, search_deadline, searcher)
+            except SearchTimeout:
+                if not skipped:
+                    break
+                skipped = False
+                depth = 2
+                continue
+            skipped = False
+            finished = time.perf_counter()
+            if finished + (finished - started) * 2 > deadline:
+                break
+            depth += 1
+        return searcher
+
+    def solve_endgame(self, state, deadline=None):
+        '''
+            Exact best move from the endgame solver, or None if it has no
+            move or runs out of time. With a deadline the solver gets half of
+            the remaining time so the heuristic search can still use the rest,
+            and without one it gets endgame_seconds.
+        '''
+        if self.backend != 'bitboard':
+            state = BitboardGameState.from_state(state)
+        self.endgame.deadline = None
+        now = time.perf_counter()
+        if deadline is not None:
+            self.endgame.deadline = now + (deadline - now) / 2
+        elif self.endgame_seconds is not None:
+            self.endgame.deadline = now + self.endgame_seconds
+        try:
+            move, _ = self.endgame.solve(state)
+        except SearchTimeout:
+            return None
+        return move
+
+    def set_weights(self, state):
+        state.weights = self.weights
+
+    def ponder(self, state, move):
+        '''
+            Start thinking about the opponent's replies to "move", which we
+            just played on "state". Does nothing unless pondering is on.
+        '''
+        if self.ponderer is None or move is None:
+            return
+        state = BitboardGameState.from_state(state)
+        self.set_weights(state)
+        state.make_move(move)
+        empties = 64 - state.get_piece_count(1) - state.get_piece_count(2)
+        # The endgame solver is quick enough without help
+        if self.endgame is not None and empties - 1 <= self.endgame.empties_threshold:
+            return
+        if self.table is not None:
+            self.table.new_search()
+        self.ponderer.start(state)
+
+    def close(self):
+        '''Stop pondering and shut down the helper processes, if any'''
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    def finish_move(self, move, source, deadline=None):
+        '''Write the telemetry record of this move, if any, and return the move'''
+        if self.record is not None:
+            self.telemetry.record(self.record, source, move, deadline)
+            self.record = None
+        return move
+
+    def make_move(self, state, received=None):
         '''
         This is the only function that needs to be implemented for the lab!
         The bot should take a game state and return a move.
@@ -75,28 +535,60 @@ class ReversiBot:
         moves for that state is returned in the form of a list of tuples.
 
         Move should be a tuple (row, col) of the move you want the bot to make.
+
+        received is the time.perf_counter() at which the state arrived from
+        the server, if it may have waited since; the move's budget counts
+        from then.
         '''
-        initial_beta = float("inf")
-        initial_alpha = float("-inf")
-        root_node = MiniMax(state, None, None, self.max_depth, initial_alpha, initial_beta)
-        root_node.state.w_1 = self.w_1
-        root_node.state.w_2 = self.w_2
-        root_node.state.w_3 = self.w_3
-        root_node.state.w_4 = self.w_4
-        root_node.state.w_5 = self.w_5
-        root_node.state.w_6 = self.w_6
-        root_node.state.w_7 = self.w_7
-        root_node.expand(True)
-        best_score = float("-inf")
-        best_move = None
+        pondered = None
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        if self.telemetry is not None:
+            self.record = self.telemetry.start_move(self, state)
+        if self.book is not None:
+            move = self.book.lookup_state(state)
+            if move is not None:
+                return self.finish_move(move, 'book')
 
-        if self.w_6 == 1:
-            best_move = rand.choice(root_node.children)
-            return best_move.move
+        time_remaining = state.time_remaining(state.turn)
+        if self.backend == 'bitboard':
+            state = BitboardGameState.from_state(state)
         else:
-            for child in root_node.children:
-                if child.cost > best_score:
-                    best_score = child.cost
-                    best_move = child.move
+            state = state.clone_state()
+        self.set_weights(state)
+        if self.ponderer is not None:
+            pondered = self.ponderer.lookup(state)
+        if self.table is not None:
+            self.table.new_search()
+        self.orderer.new_search()
+        self.orderer.previous_best = None
 
-        return best_move
+        empties = 64 - state.get_piece_count(1) - state.get_piece_count(2)
+        deadline = None
+        if time_remaining is not None:
+            deadline = self.time_manager.deadline(time_remaining, empties, received)
+
+        if self.endgame is not None and empties <= self.endgame.empties_threshold:
+            move = self.solve_endgame(state, deadline)
+            if move is not None:
+                return self.finish_move(move, 'endgame', deadline)
+
+        source = 'search'
+        if deadline is None and pondered is not None and pondered[0] >= self.max_depth:
+            searcher = pondered[1]
+            source = 'pondered'
+        else:
+            if self.parallel is not None:
+                self.parallel.start(state, self.max_depth if deadline is None else empties, deadline)
+            try:
+                if deadline is None:
+                    searcher = self.search(state, self.max_depth)
+                else:
+                    searcher = self.iterative_deepening(state, deadline, pondered)
+            finally:
+                if self.parallel is not None:
+                    self.parallel.finish()
+
+        if self.w_6 == 1 and searcher.root_scores:
+            return self.finish_move(rand.choice(list(searcher.root_scores)), source, deadline)
+        return self.finish_move(searcher.best_move(), source, deadline)
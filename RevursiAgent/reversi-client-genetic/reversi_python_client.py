@@ -1,5 +1,7 @@
 import reversi
 import sys
+from patterns import PatternEvaluator
+from opening_book import OpeningBook
 
 if __name__ == '__main__':
     server_address = sys.argv[1]
@@ -12,10 +14,18 @@ if __name__ == '__main__':
     w_5 = float(sys.argv[8])
     w_6 = float(sys.argv[9])
     w_7 = float(sys.argv[10])
+    # Optional pattern table file, e.g. pattern_tables.bin, replaces the weighted features ("-" for none)
+    evaluator = PatternEvaluator.load(sys.argv[11]) if len(sys.argv) > 11 and sys.argv[11] != '-' else None
+    # Optional opening book file, e.g. opening_book.bin ("-" for none)
+    book = OpeningBook(sys.argv[12]) if len(sys.argv) > 12 and sys.argv[12] != '-' else None
+    # Optional number of search processes
+    workers = int(sys.argv[13]) if len(sys.argv) > 13 else 1
+    # Optional 1 to think on the opponent's time
+    ponder = len(sys.argv) > 14 and sys.argv[14] == '1'
 
     print(f"w_1: {w_1}, w_2: {w_2}, w_3: {w_3}, w_4: {w_4}, w_5: {w_5}, w_6: {w_6}, w_7: {w_7}")
 
-    reversi_game = reversi.ReversiGame(server_address, bot_move_number, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7)
+    reversi_game = reversi.ReversiGame(server_address, bot_move_number, max_depth, w_1, w_2, w_3, w_4, w_5, w_6, w_7, evaluator, book, workers, ponder)
     reversi_game.play()
 
 
@@ -0,0 +1,178 @@
+import json
+import os
+import sys
+import time
+
+# Optional search instrumentation. A ReversiBot given a Telemetry writes one
+# JSON line per move with where the move came from (book, endgame solver,
+# search), the time it took, and for searched moves every iteration's
+# nodes, leaves, beta cutoffs per ply, effective branching factor, and the
+# time spent in move generation, make/unmake and evaluation. Without one,
+# MiniMax and ReversiBot only test "is not None" and do no extra work.
+
+
+class TimedState:
+    '''
+        Stands in for a game state and adds the time spent in
+        get_valid_moves and make_move/unmake_move to a SearchStats. Every
+        other attribute is the wrapped state's.
+    '''
+    def __init__(self, state, stats):
+        self.__dict__['state'] = state
+        self.__dict__['stats'] = stats
+
+    def __getattr__(self, name):
+        return getattr(self.state, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.state, name, value)
+
+    def get_valid_moves(self):
+        started = time.perf_counter()
+        moves = self.state.get_valid_moves()
+        self.stats.movegen_seconds += time.perf_counter() - started
+        return moves
+
+    def make_move(self, move):
+        started = time.perf_counter()
+        self.state.make_move(move)
+        self.stats.make_seconds += time.perf_counter() - started
+
+    def unmake_move(self):
+        started = time.perf_counter()
+        self.state.unmake_move()
+        self.stats.make_seconds += time.perf_counter() - started
+
+
+class SearchStats:
+    '''Counters for one MiniMax search, filled in by the search'''
+    def __init__(self, depth):
+        self.depth = depth
+        self.finished = False
+        self.nodes = 0
+        self.leaves = 0
+        # Beta cutoffs by ply
+        self.cutoffs = []
+        self.seconds = 0.0
+        self.movegen_seconds = 0.0
+        self.make_seconds = 0.0
+        self.eval_seconds = 0.0
+
+    def cutoff(self, ply):
+        while len(self.cutoffs) <= ply:
+            self.cutoffs.append(0)
+        self.cutoffs[ply] += 1
+
+    def to_dict(self):
+        return {
+            'depth': self.depth,
+            'finished': self.finished,
+            'nodes': self.nodes,
+            'leaves': self.leaves,
+            'cutoffs': self.cutoffs,
+            'ebf': round(self.nodes ** (1 / self.depth), 3) if self.nodes and self.depth else None,
+            'seconds': round(self.seconds, 6),
+            'movegen_seconds': round(self.movegen_seconds, 6),
+            'make_seconds': round(self.make_seconds, 6),
+            'eval_seconds': round(self.eval_seconds, 6),
+        }
+
+
+class MoveRecord:
+    '''Everything measured while choosing one move'''
+    def __init__(self, bot, state):
+        self.started = time.perf_counter()
+        self.fields = {
+            'player': state.turn,
+            'max_depth': bot.max_depth,
+            'weights': [bot.w_1, bot.w_2, bot.w_3, bot.w_4, bot.w_5, bot.w_6, bot.w_7],
+            'empties': int(64 - state.get_piece_count(1) - state.get_piece_count(2)),
+            'time_remaining': state.time_remaining(state.turn),
+        }
+        self.searches = []
+
+    def new_search(self, depth):
+        stats = SearchStats(depth)
+        self.searches.append(stats)
+        return stats
+
+    def to_dict(self, source, move, deadline=None):
+        fields = dict(self.fields)
+        fields['source'] = source
+        fields['move'] = list(move) if move is not None else None
+        fields['seconds'] = round(time.perf_counter() - self.started, 6)
+        if deadline is not None:
+            fields['budget'] = round(deadline - self.started, 6)
+        finished = [stats for stats in self.searches if stats.finished]
+        fields['depth'] = finished[-1].depth if finished else None
+        # Growth of the tree from one finished depth to the next
+        if len(finished) > 1 and finished[-2].nodes:
+            fields['ebf'] = round(finished[-1].nodes / finished[-2].nodes, 3)
+        elif finished:
+            fields['ebf'] = finished[-1].to_dict()['ebf']
+        for name in ('nodes', 'leaves', 'movegen_seconds', 'make_seconds', 'eval_seconds'):
+            fields[name] = sum(getattr(stats, name) for stats in self.searches)
+            if name.endswith('seconds'):
+                fields[name] = round(fields[name], 6)
+        fields['searches'] = [stats.to_dict() for stats in self.searches]
+        return fields
+
+
+class Telemetry:
+    '''
+        Appends move records to a JSON Lines file. Each record is written
+        with a single write to a file opened for appending, so several
+        processes (a parallel tournament) can share one file. The file is
+        opened on first use and reopened after pickling.
+    '''
+    def __init__(self, path, **context):
+        self.path = path
+        # Extra fields written with every record, e.g. a game or bot name
+        self.context = context
+        self.fd = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'context': self.context, 'fd': None}
+
+    def start_move(self, bot, state):
+        return MoveRecord(bot, state)
+
+    def record(self, record, source, move, deadline=None):
+        fields = dict(self.context)
+        fields.update(record.to_dict(source, move, deadline))
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self.fd, (json.dumps(fields) + '\n').encode('utf-8'))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records, slowest=10):
+    '''Totals over a telemetry file and the slowest moves, for the command line'''
+    searched = [record for record in records if record['source'] == 'search']
+    nodes = sum(record['nodes'] for record in searched)
+    seconds = sum(record['seconds'] for record in searched)
+    print(f"{len(records)} moves, {len(searched)} searched, {nodes} nodes in {seconds:.2f}s "
+          f"({nodes / seconds if seconds else 0:.0f} nodes/s)")
+    if seconds:
+        for name in ('movegen_seconds', 'make_seconds', 'eval_seconds'):
+            share = sum(record[name] for record in searched) / seconds
+            print(f"    {name:16s} {share:6.1%}")
+    print("Slowest moves:")
+    for record in sorted(records, key=lambda record: record['seconds'], reverse=True)[:slowest]:
+        print(f"    {record['seconds']:8.3f}s  {record['source']:8s} depth {record['depth']} "
+              f"max_depth {record['max_depth']} empties {record['empties']} nodes {record.get('nodes')} "
+              f"ebf {record.get('ebf')} weights {record['weights']}")
+
+
+if __name__ == "__main__":
+    # python telemetry.py <telemetry jsonl> [number of slowest moves]
+    summarize(read_records(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 10)
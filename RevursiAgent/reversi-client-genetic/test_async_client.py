@@ -0,0 +1,28 @@
+import asyncio
+import async_client
+import game_server
+
+WEIGHTS = [0.234, 0.5999, 0.3, 0.405, 0.777, 0, 0.2]
+PORT_BASE = 47300
+
+
+async def play_queued_games(games, minutes, processes):
+    '''Play games against game_server with all their bots on "processes" workers'''
+    servers = [asyncio.create_task(game_server.play_game('127.0.0.1', PORT_BASE + 2 * game, minutes, pace=False))
+               for game in range(games)]
+    # Let the servers start listening
+    await asyncio.sleep(0.5)
+    specs = [{'host': '127.0.0.1', 'port': PORT_BASE + 2 * game + player, 'player': player,
+              'max_depth': 4, 'weights': WEIGHTS}
+             for game in range(games) for player in (1, 2)]
+    errors = await async_client.run_bots(specs, processes)
+    return errors, await asyncio.gather(*servers)
+
+
+def test_queued_bots_do_not_lose_on_time():
+    # 12 bots share one worker, so most states wait in the queue before
+    # they are searched. The server sets a clock that ran out to 0.
+    errors, results = asyncio.run(play_queued_games(6, 0.1, 1))
+    assert errors == []
+    for result in results:
+        assert result['t1'] > 0 and result['t2'] > 0
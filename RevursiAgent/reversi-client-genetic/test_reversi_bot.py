@@ -0,0 +1,62 @@
+import time
+from bitboard import BitboardGameState
+from reversi_bot import ReversiBot
+from time_manager import SearchTimeout
+
+WEIGHTS = (0.234, 0.5999, 0.3, 0.405, 0.777, 0, 0.2)
+
+
+class DepthLoggingBot(ReversiBot):
+    '''
+        ReversiBot that remembers the depth of every search it starts, and
+        times out the first search of timeout_depth, if given
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depths = []
+        self.timeout_depth = None
+
+    def search(self, state, depth, deadline=None, previous=None):
+        self.depths.append(depth)
+        if depth == self.timeout_depth:
+            self.timeout_depth = None
+            raise SearchTimeout()
+        return super().search(state, depth, deadline, previous)
+
+
+def predicted_line(reuse, timeout_depth=None):
+    '''
+        Search the opening position to depth 5, play the best move and the
+        reply the search expected, and return the bot with the depths
+        iterative deepening then searched on the new position
+    '''
+    state = BitboardGameState([0, 0, 0], 1, *WEIGHTS)
+    for move in ((3, 3), (3, 4), (4, 4), (4, 3)):
+        state.make_move(move)
+    bot = DepthLoggingBot(1, 5, *WEIGHTS, endgame_empties=0, reuse=reuse)
+    bot.table.new_search()
+    searcher = bot.search(state, 5)
+    state.make_move(searcher.best_move())
+    state.make_move(bot.table.probe(state.hash)[3])
+
+    bot.depths = []
+    bot.timeout_depth = timeout_depth
+    bot.table.new_search()
+    bot.iterative_deepening(state, time.perf_counter() + 0.2)
+    return bot
+
+
+def test_iterative_deepening_starts_at_reused_depth():
+    # The reply two plies below the depth 5 root was searched to depth 3
+    bot = predicted_line(reuse=True)
+    assert bot.depths[:2] == [1, 3]
+
+
+def test_iterative_deepening_without_reuse_searches_every_depth():
+    bot = predicted_line(reuse=False)
+    assert bot.depths[:2] == [1, 2]
+
+
+def test_iterative_deepening_deepens_normally_after_a_failed_skip():
+    bot = predicted_line(reuse=True, timeout_depth=3)
+    assert bot.depths[:4] == [1, 3, 2, 3]
@@ -0,0 +1,49 @@
+import time
+
+
+class SearchTimeout(Exception):
+    '''Raised inside a search when its deadline has passed'''
+    pass
+
+
+class TimeManager:
+    '''
+        Splits the remaining clock into per-move budgets. The clock is spread
+        over the moves we still expect to make, then scaled by game phase:
+        little time in the opening, the most in the midgame where search
+        matters, and a normal share in the endgame.
+    '''
+    def __init__(self, safety_margin=2.0, min_budget=0.05,
+                 opening_factor=0.5, midgame_factor=1.4, endgame_factor=1.0):
+        self.safety_margin = safety_margin
+        self.min_budget = min_budget
+        self.opening_factor = opening_factor
+        self.midgame_factor = midgame_factor
+        self.endgame_factor = endgame_factor
+
+    def phase_factor(self, empties):
+        if empties > 44:
+            return self.opening_factor
+        if empties > 16:
+            return self.midgame_factor
+        return self.endgame_factor
+
+    def budget(self, time_remaining, empties):
+        '''Seconds to spend on this move'''
+        usable = time_remaining - self.safety_margin
+        if usable <= self.min_budget:
+            return self.min_budget
+        # We make about half of the remaining moves
+        moves_left = max(1, (empties + 1) // 2)
+        budget = usable / moves_left * self.phase_factor(empties)
+        # Never bet more than half of what's left on one move
+        return max(self.min_budget, min(budget, usable / 2))
+
+    def deadline(self, time_remaining, empties, started=None):
+        '''
+            perf_counter time to finish this move by. started is when our
+            clock started running for it, by default now.
+        '''
+        if started is None:
+            started = time.perf_counter()
+        return started + self.budget(time_remaining, empties)
@@ -0,0 +1,198 @@
+import random
+import numpy as np
+from multiprocessing import shared_memory
+
+# Zobrist keys: one random 64-bit number per (player, square), plus one that
+# is mixed in when it's player 2's turn. Seeded so hashes are reproducible
+# between runs and processes.
+_rng = random.Random(470)
+ZOBRIST_PIECES = [[0] * 64] + [[_rng.getrandbits(64) for _ in range(64)] for _ in range(2)]
+ZOBRIST_FLIP = [ZOBRIST_PIECES[1][sq] ^ ZOBRIST_PIECES[2][sq] for sq in range(64)]
+ZOBRIST_TURN = _rng.getrandbits(64)
+
+# Bound types for stored scores
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high, the real score is >= the stored one
+UPPER_BOUND = 2  # the search failed low, the real score is <= the stored one
+
+# key (8) + score (8) + depth, bound, move, age (1 each)
+ENTRY_BYTES = 20
+
+# Odd multiplier that spreads an entry's depth, bound and move over 64 bits
+# for SharedTranspositionTable's check
+MIX = 0x9E3779B97F4A7C15
+
+
+def zobrist_hash(pieces, turn):
+    '''Hash a position from scratch. Searches update it incrementally instead.'''
+    key = ZOBRIST_TURN if turn == 2 else 0
+    for player in (1, 2):
+        bits = pieces[player]
+        while bits:
+            low_bit = bits & -bits
+            key ^= ZOBRIST_PIECES[player][low_bit.bit_length() - 1]
+            bits ^= low_bit
+    return key
+
+
+class TranspositionTable:
+    '''
+        Fixed-size hash table of search results keyed by Zobrist hash. The
+        number of slots is the largest power of two that fits in max_bytes.
+        A slot is overwritten by a new result when it is empty, holds the
+        same position, was written by an earlier search, or was searched to
+        a depth no greater than the new result (depth-preferred with aging).
+        Reading an entry makes it current again, so the part of the last
+        move's tree that the new search passes through is kept while the
+        lines the game didn't take become replaceable.
+    '''
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        slots = max(1, max_bytes // ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.allocate()
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    def allocate(self):
+        self.keys = np.zeros(self.size, dtype=np.uint64)
+        self.scores = np.zeros(self.size, dtype=np.float64)
+        self.depths = np.full(self.size, -1, dtype=np.int8)
+        self.bounds = np.zeros(self.size, dtype=np.int8)
+        self.moves = np.full(self.size, -1, dtype=np.int8)
+        self.ages = np.zeros(self.size, dtype=np.uint8)
+
+    def new_search(self):
+        '''Call once per root search so older entries become replaceable'''
+        self.age = (self.age + 1) & 0xFF
+
+    def clear(self):
+        self.keys.fill(0)
+        self.depths.fill(-1)
+        self.moves.fill(-1)
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        '''Return (depth, bound, score, move) for the position, or None'''
+        self.probes += 1
+        index = key & self.mask
+        if self.depths[index] < 0 or int(self.keys[index]) != key:
+            return None
+        self.hits += 1
+        self.ages[index] = self.age
+        square = int(self.moves[index])
+        move = None if square < 0 else (square >> 3, square & 7)
+        return int(self.depths[index]), int(self.bounds[index]), float(self.scores[index]), move
+
+    def store(self, key, depth, bound, score, move):
+        index = key & self.mask
+        stored_depth = self.depths[index]
+        if stored_depth >= 0 and int(self.keys[index]) != key and \
+                self.ages[index] == self.age and depth < stored_depth:
+            return
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.bounds[index] = bound
+        self.scores[index] = score
+        self.moves[index] = -1 if move is None else move[0] * 8 + move[1]
+        self.ages[index] = self.age
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+
+class SharedTranspositionTable(TranspositionTable):
+    '''
+        TranspositionTable whose arrays live in one
+        multiprocessing.shared_memory block, so several processes can search
+        with the same table. The process that creates it (name=None) owns
+        the block; other processes attach with the owner's name and the same
+        max_bytes. Each process keeps its own age and probe counts.
+
+        Entries are read and written without locks. Instead of the key
+        itself each slot holds the key XORed with a hash of the entry's
+        score, depth, bound and move (see check), and the key is only
+        accepted if it comes back out of the data read alongside it. An
+        entry with fields from two different writes, such as two processes
+        storing the same position at once, then fails the check except
+        with negligible probability (about 2**-64) and is treated as a
+        miss. The age is not covered, as it only decides replacement.
+    '''
+    def __init__(self, max_bytes=16 * 1024 * 1024, name=None):
+        self.name = name
+        super().__init__(max_bytes)
+
+    def allocate(self):
+        owner = self.name is None
+        if owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.size * ENTRY_BYTES)
+            self.name = self.memory.name
+        else:
+            self.memory = shared_memory.SharedMemory(name=self.name)
+        self.owner = owner
+        buffer = self.memory.buf
+        offset = 0
+        arrays = []
+        for dtype in (np.uint64, np.float64, np.int8, np.int8, np.int8, np.uint8):
+            arrays.append(np.ndarray(self.size, dtype=dtype, buffer=buffer, offset=offset))
+            offset += self.size * np.dtype(dtype).itemsize
+        self.keys, self.scores, self.depths, self.bounds, self.moves, self.ages = arrays
+        # The scores' bits, for check
+        self.score_bits = self.scores.view(np.uint64)
+        if owner:
+            self.clear()
+
+    @staticmethod
+    def check(score_bits, depth, bound, square):
+        '''Hash of an entry's data, XORed into its stored key'''
+        fields = (depth & 0xFF) | (bound & 0xFF) << 8 | (square & 0xFF) << 16
+        return score_bits ^ ((fields + 1) * MIX & 0xFFFFFFFFFFFFFFFF)
+
+    def read(self, index):
+        '''(key, depth, bound, score, square) of a slot, the key recovered with check'''
+        stored = int(self.keys[index])
+        score_bits = int(self.score_bits[index])
+        depth = int(self.depths[index])
+        bound = int(self.bounds[index])
+        square = int(self.moves[index])
+        key = stored ^ self.check(score_bits, depth, bound, square)
+        return key, depth, bound, float(np.uint64(score_bits).view(np.float64)), square
+
+    def probe(self, key):
+        self.probes += 1
+        index = key & self.mask
+        if self.depths[index] < 0:
+            return None
+        stored_key, depth, bound, score, square = self.read(index)
+        if stored_key != key or depth < 0:
+            return None
+        self.hits += 1
+        self.ages[index] = self.age
+        move = None if square < 0 else (square >> 3, square & 7)
+        return depth, bound, score, move
+
+    def store(self, key, depth, bound, score, move):
+        index = key & self.mask
+        stored_key, stored_depth, _, _, _ = self.read(index)
+        if stored_depth >= 0 and stored_key != key and \
+                self.ages[index] == self.age and depth < stored_depth:
+            return
+        square = -1 if move is None else move[0] * 8 + move[1]
+        score = np.float64(score)
+        self.depths[index] = depth
+        self.bounds[index] = bound
+        self.scores[index] = score
+        self.moves[index] = square
+        self.ages[index] = self.age
+        self.keys[index] = key ^ self.check(int(score.view(np.uint64)), depth, bound, square)
+
+    def close(self):
+        '''Detach from the block, and free it if this process created it'''
+        # The arrays point into the block and must go before it can close
+        self.keys = self.scores = self.depths = self.bounds = self.moves = self.ages = None
+        self.score_bits = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()